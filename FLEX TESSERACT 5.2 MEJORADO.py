@@ -3,7 +3,17 @@
 # ==============================
 # Requisitos:
 #   pip install pillow pytesseract pandas ttkbootstrap (opcional)
-#   (Para exportación Markdown: pip install tabulate)
+#   (pandas, Pillow y pytesseract se importan recién al usarlos; "--medir-arranque" abre, mide y cierra)
+#   (Para exportación Markdown: pip install tabulate — Parquet: pip install pyarrow)
+#   (Excel detallado en streaming: pip install xlsxwriter — si no está se usa openpyxl en modo write-only)
+#   (Lectura rápida del QR/código de barras de la etiqueta Flex: pip install pyzbar — requiere libzbar)
+#   (Vigilancia de carpeta por eventos del SO: pip install watchdog — sin él se usa sondeo por mtime)
+#   (Tesseract: se busca en "tesseract_cmd" de config.json, TESSERACT_CMD, el PATH y las rutas de Windows)
+#   (Snapshot del estado más rápido de leer/escribir: pip install msgpack — sin él va JSON comprimido)
+#
+# API HTTP local (tablero de despacho): "api_activa": true en config.json la levanta con la ventana;
+#   python "FLEX TESSERACT 5.2 MEJORADO.py" --api  la corre sola, sin ventana.
+#   --reclasificar  vuelve a pasar los pendientes por el clasificador (texto OCR guardado) y sale.
 #
 # Cambios clave vs 5.3:
 # - Persistencia detallada REAL por etiqueta (siempre) con: Cordon, Ciudad, Subregión, Src, Manual, ts.
@@ -15,28 +25,256 @@
 # - Limpieza de código y comentarios.
 
 import os
+import re
+import sys
 import json
+import math
+import gzip
+import zlib
+import struct
+import unicodedata
+import time
+T_INICIO = time.perf_counter()  # medición de arranque (ver "Arranque" y --medir-arranque)
+import hashlib
+import queue
 import zipfile
-from datetime import datetime
+import bisect
+import difflib
+import functools
+import threading
+import importlib
+import importlib.util
+import shutil
+import subprocess
+from urllib.parse import urlsplit, parse_qs
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk
-import pytesseract
-import pandas as pd
+import numpy as np
+
+
+# === Arranque: módulos pesados diferidos + medición ===
+ARRANQUE = []  # [(etapa, segundos desde T_INICIO)]
+
+
+def marcar_arranque(etapa: str) -> None:
+    ARRANQUE.append((etapa, time.perf_counter() - T_INICIO))
+
+
+def resumen_arranque() -> str:
+    etapas = " · ".join(f"{e} {t:.2f} s" for e, t in ARRANQUE)
+    cargados = [m._nombre for m in ModuloDiferido.todos if m.cargado]
+    return etapas + (f" (ya cargados: {', '.join(cargados)})" if cargados else "")
+
+
+class ModuloDiferido:
+    """
+    Módulo que se importa recién en el primer acceso a un atributo (pd.DataFrame,
+    pytesseract.image_to_data, ...), así abrir la ventana no paga pandas ni Tesseract.
+    `al_cargar` corre una vez con el módulo recién importado; si falla, se reintenta en el próximo uso.
+    """
+
+    todos = []
+
+    def __init__(self, nombre: str, al_cargar=None):
+        self._nombre = nombre
+        self._al_cargar = al_cargar
+        self._modulo = None
+        self._lock = threading.Lock()
+        ModuloDiferido.todos.append(self)
+
+    @property
+    def cargado(self) -> bool:
+        return self._modulo is not None
+
+    def _cargar(self):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    mod = importlib.import_module(self._nombre)
+                    if self._al_cargar is not None:
+                        self._al_cargar(mod)
+                    self._modulo = mod
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._cargar(), atributo)
+
+
+# === Motor OCR: búsqueda de Tesseract (config → variable de entorno → PATH → rutas de Windows) ===
+RUTAS_TESSERACT_WINDOWS = (
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    os.path.join(os.environ.get("LOCALAPPDATA", ""), "Programs", "Tesseract-OCR", "tesseract.exe"),
+)
+
+
+class MotorOCR:
+    """
+    Elige una vez el backend de OCR disponible y lo informa:
+    - "tesseract": ejecutable encontrado, responde a --version y tiene el idioma "eng".
+    - "solo QR": no hay Tesseract (o falta pytesseract); las etiquetas se leen sólo por QR y las
+      que no se resuelven así quedan pendientes para confirmar a mano, sin un error por imagen.
+    Candidatos en orden: "tesseract_cmd" de config.json, variable TESSERACT_CMD, PATH y las rutas
+    de instalación habituales de Windows. La verificación (versión e idiomas) se guarda en
+    `cache` por ruta + firma del ejecutable, así los arranques siguientes no lanzan procesos.
+    """
+
+    VARIABLE = "TESSERACT_CMD"
+
+    def __init__(self, cache: str):
+        self.cache = cache
+        self.cmd_config = ""
+        self.backend = None      # "tesseract" | "solo QR" (None = sin detectar todavía)
+        self.cmd = None
+        self.version = None
+        self.origen = None       # "config" | "entorno" | "PATH" | "Windows"
+        self.motivo = ""         # por qué se descartaron los candidatos anteriores al elegido
+        self._lock = threading.Lock()
+
+    def configurar(self, cfg: dict) -> None:
+        self.cmd_config = (cfg.get("tesseract_cmd") or "").strip()
+
+    def detectar_en_hilo(self) -> None:
+        """Detecta en segundo plano para no demorar la ventana; el primer OCR espera si hace falta."""
+        threading.Thread(target=self.detectar, name="motor-ocr", daemon=True).start()
+
+    def detectar(self) -> str:
+        if self.backend is None:
+            with self._lock:
+                if self.backend is None:
+                    self._detectar()
+        return self.backend
+
+    def disponible(self) -> bool:
+        return self.detectar() == "tesseract"
+
+    def descripcion(self) -> str:
+        self.detectar()
+        if self.backend == "tesseract":
+            nota = f"; descartados: {self.motivo}" if self.motivo else ""
+            return f"OCR: Tesseract {self.version} ({self.origen}{nota})"
+        return f"OCR: sólo QR — {self.motivo}"
+
+    # --- detección ---
+    def _candidatos(self):
+        if self.cmd_config:
+            yield "config", self.cmd_config
+        if os.environ.get(self.VARIABLE):
+            yield "entorno", os.environ[self.VARIABLE]
+        en_path = shutil.which("tesseract")
+        if en_path:
+            yield "PATH", en_path
+        if os.name == "nt":
+            for ruta in RUTAS_TESSERACT_WINDOWS:
+                yield "Windows", ruta
+
+    def _detectar(self) -> None:
+        if importlib.util.find_spec("pytesseract") is None:
+            self.backend, self.motivo = "solo QR", "falta pytesseract (pip install pytesseract)"
+            return
+
+        cache = load_json(self.cache, {})
+        descartes = []
+        vistos = set()
+        for origen, ruta in self._candidatos():
+            ruta = shutil.which(ruta) or ruta  # acepta "tesseract" a secas en config/entorno
+            if ruta in vistos:
+                continue
+            vistos.add(ruta)
+            firma = firma_archivo(ruta)
+            if firma is None:
+                descartes.append(f"{origen}: no existe {ruta}")
+                continue
+            previa = cache.get(ruta)
+            if previa and tuple(previa["firma"]) == firma:
+                version, idiomas = previa["version"], previa["idiomas"]
+            else:
+                try:
+                    version, idiomas = self._sondear(ruta)
+                except (OSError, subprocess.SubprocessError) as e:
+                    descartes.append(f"{origen}: {ruta} no responde ({e})")
+                    continue
+                cache[ruta] = {"firma": list(firma), "version": version, "idiomas": idiomas}
+                save_json(self.cache, cache, indent=None)
+            if "eng" not in idiomas:
+                descartes.append(f"{origen}: {ruta} sin el idioma eng")
+                continue
+            self.backend, self.cmd, self.version, self.origen = "tesseract", ruta, version, origen
+            self.motivo = "; ".join(descartes)
+            return
+
+        self.backend = "solo QR"
+        self.motivo = "; ".join(descartes) or (
+            "no se encontró Tesseract (instalarlo, agregarlo al PATH o indicar "
+            f"\"tesseract_cmd\" en {CONFIG_FILE} / {self.VARIABLE})"
+        )
+
+    @staticmethod
+    def _sondear(ruta: str):
+        """(versión, idiomas) del ejecutable; ambas salidas van a stdout o stderr según la versión."""
+        def correr(*args):
+            r = subprocess.run([ruta, *args], capture_output=True, text=True, timeout=15, check=True)
+            return (r.stdout or r.stderr).splitlines()
+
+        version = correr("--version")[0].split()[-1].lstrip("v")
+        idiomas = [l.strip() for l in correr("--list-langs")[1:] if l.strip()]
+        return version, idiomas
+
 
-# === OCR (ajustar a tu path de instalación en Windows si fuera distinto) ===
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+def _preparar_tesseract(mod) -> None:
+    """Primer uso del OCR: apunta pytesseract al ejecutable detectado por MOTOR_OCR."""
+    if not MOTOR_OCR.disponible():
+        raise RuntimeError(f"Tesseract no disponible: {MOTOR_OCR.motivo}")
+    mod.pytesseract.tesseract_cmd = MOTOR_OCR.cmd
 
-# === UI Moderna opcional ===
+
+pytesseract = ModuloDiferido("pytesseract", al_cargar=_preparar_tesseract)
+pd = ModuloDiferido("pandas")           # sólo exportaciones
+Image = ModuloDiferido("PIL.Image")
+ImageOps = ModuloDiferido("PIL.ImageOps")
+ImageTk = ModuloDiferido("PIL.ImageTk")  # miniaturas de pendientes
+asyncio = ModuloDiferido("asyncio")     # sólo la API HTTP
+http = ModuloDiferido("http")
+futuros = ModuloDiferido("concurrent.futures")  # API y relectura de pendientes
+
+# === Lectura de QR/códigos de barras opcional ===
 try:
-    import ttkbootstrap as ttkb
-    from ttkbootstrap.constants import *
-    BOOTSTRAP = True
+    from pyzbar import pyzbar
+    ZBAR = True
 except Exception:
-    BOOTSTRAP = False
+    ZBAR = False
+
+# === Vigilancia de carpeta por eventos opcional ===
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG = True
+except Exception:
+    WATCHDOG = False
+
+# === Serialización binaria rápida del snapshot opcional ===
+try:
+    import msgpack
+    MSGPACK = True
+except Exception:
+    MSGPACK = False
+
+# === Lock entre procesos (flock en POSIX, msvcrt en Windows) ===
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# === Escritura de Excel en streaming opcional (se importa recién al exportar) ===
+XLSXWRITER = importlib.util.find_spec("xlsxwriter") is not None
+xlsxwriter = ModuloDiferido("xlsxwriter")
 
 # === Datos base ===
-CORDONES = {
+# Valores por defecto si no existe tarifas.json (ver sección "Tarifas y zonas").
+CORDONES_BASE = {
     "Primer cordón": [
         "AVELLANEDA", "HURLINGHAM", "ITUZAINGO", "LA MATANZA NORTE", "LANUS",
         "LOMAS DE ZAMORA", "MORON", "SAN FERNANDO", "SAN ISIDRO", "SAN MARTIN",
@@ -55,7 +293,7 @@ CORDONES = {
         "MARCOS PAZ", "NORDELTA", "PILAR", "SAN VICENTE", "VILLA ROSA", "ZARATE"
     ]
 }
-PRECIOS = {
+PRECIOS_BASE = {
     "Primer cordón": 5538,
     "Segundo cordón": 7638,
     "Tercer cordón (CABA)": 3457,
@@ -63,9 +301,52 @@ PRECIOS = {
 }
 
 # === Archivos persistentes ===
-DATA_FILE = "data_semanal.json"    # { "Lunes": { "Primer cordón": n, ... }, ... }
-SUBREG_FILE = "subregiones.json"   # { "Lunes": [ {Cordon, Ciudad, Subregión, Src, Manual, ts}, ... ], ... }
-PEND_FILE = "pendientes.json"      # [ "path/img1.jpg", ... ]
+# Todo se resuelve contra la carpeta del script, no contra el directorio de trabajo: la ventana, --api
+# y --reclasificar leen y escriben los mismos archivos los lance quien los lance (acceso directo,
+# servicio, otra carpeta)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def en_base(nombre: str) -> str:
+    return os.path.join(BASE_DIR, nombre)
+
+
+SNAPSHOT_FILE = en_base("estado.snap")          # Conteos + detallado + pendientes en columnas con códigos (ver "Snapshot binario")
+# Esquema anterior (5.4): se importan una sola vez al snapshot y quedan renombrados como *.importado
+DATA_FILE = en_base("data_semanal.json")        # { "2025-10-06": { "Primer cordón": n, ... }, ... }  (fecha ISO real)
+SUBREG_FILE = en_base("subregiones.json")       # { "2025-10-06": [ {Cordon, Ciudad, Subregión, Src, Manual, ts, Envio, Cliente}, ... ], ... }
+PEND_FILE = en_base("pendientes.json")          # [ "path/img1.jpg", ... ]
+LOCK_FILE = en_base("datos.lock")               # Lock consultivo: GUI y worker sin ventana sobre la misma carpeta
+CONFIG_FILE = en_base("config.json")            # Preferencias locales (ver CONFIG_DEFAULT)
+HIST_DIR = en_base("historial")                 # semana_<AAAA-Wss>.json.gz por semana archivada + indice.json con totales
+AVANCE_FILE = en_base("avance.log")             # Una línea JSON por imagen aplicada desde el último guardado completo
+TRABAJOS_FILE = en_base("trabajos.json")        # { id: {estado, fecha, cliente, origen, total, hechas, restantes, en_curso, ...} }
+TRABAJOS_API_FILE = en_base("trabajos_api.json")  # Cola propia del worker sin ventana (--api)
+PROCESADOS_FILE = en_base("procesados.json")    # { "version": 1, "entradas": { sha1: [path, size, mtime_ns, ts], ... } }
+APRENDIZAJE_FILE = en_base("aprendizaje.json")  # { "docs": {cordón: n}, "palabras": {palabra: {cordón: n}} } (confirmaciones manuales)
+REMITOS_FILE = en_base("remitos.json")          # { "siguiente": n, "asignados": { "fecha|cliente|cordón|localidad|domicilio": n } }
+MOTOR_FILE = en_base("motor_ocr.json")          # { ruta_tesseract: {firma, version, idiomas} } (verificación cacheada)
+TARIFAS_FILE = en_base("tarifas.json")          # { "version": n, "cordones": {...}, "precios": [ {"desde", "precios"}, ... ], "clientes": {...} }
+LOCALIDADES_FILE = en_base("localidades.json")  # { "version": n, "zonas": { zona: [localidades/barrios] }, "codigos_postales": [ [desde, hasta, zona], ... ] }
+
+CONFIG_DEFAULT = {
+    "carpeta_vigilada": "",         # Carpeta de descargas de WhatsApp sincronizada
+    "vigilancia_activa": False,     # Retomar la vigilancia al abrir la app
+    "vigilancia_intervalo_s": 2.0,  # Cada cuánto se revisan novedades
+    "vigilancia_estabilidad_s": 3.0,  # Tiempo sin cambios de tamaño/mtime para dar un archivo por completo
+    "vigilancia_desde": "",         # Al activar la vigilancia: lo anterior de la carpeta no se toma (ISO)
+    "cola_workers": 2,              # Imágenes clasificándose a la vez (carga manual, ZIPs y API)
+    "cola_max_imagenes": 5000,      # Imágenes en espera antes de rechazar lotes nuevos
+    "api_activa": False,            # Levantar la API HTTP local junto con la ventana
+    "api_host": "127.0.0.1",        # Sólo local por defecto
+    "api_puerto": 8765,
+    "api_max_mb": 50,               # Tamaño máximo de un archivo subido
+    "tesseract_cmd": "",            # Vacío = buscar (variable TESSERACT_CMD, PATH, rutas de Windows)
+    "confianza_auto": 0.80,         # Desde acá la etiqueta se cuenta sin más
+    "confianza_revisar": 0.50,      # Entre ésta y la anterior se cuenta pero queda marcada para revisar
+}
+
+EXT_IMAGENES = (".jpg", ".jpeg", ".png")
 
 
 # === JSON utils ===
@@ -77,61 +358,2664 @@ def load_json(path: str, default):
         return default
 
 
-def save_json(path: str, data) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+def reemplazar_atomico(tmp: str, path: str) -> None:
+    """tmp (ya con fsync) pasa a ser path de una sola vez: un lector ve el archivo viejo o el nuevo, nunca uno truncado."""
+    os.replace(tmp, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Que el rename mismo sobreviva a un corte de luz (POSIX)
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def escribir_atomico(path: str, contenido: bytes) -> None:
+    # Temporal propio de cada proceso e hilo: dos hilos guardando el mismo archivo no se pisan
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(contenido)
+        f.flush()
+        os.fsync(f.fileno())
+    reemplazar_atomico(tmp, path)
+
+
+def save_json(path: str, data, indent=4) -> None:
+    texto = json.dumps(data, indent=indent, ensure_ascii=False, separators=None if indent else (",", ":"))
+    escribir_atomico(path, texto.encode("utf-8"))
+
+
+class BloqueoDatos:
+    """
+    Lock consultivo sobre LOCK_FILE, para que la ventana y un worker sin ventana (u otra instancia)
+    no escriban los archivos de estado a la vez. Entre hilos del mismo proceso es un RLock:
+    sólo la primera entrada de cada hilo toma el archivo.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.nivel = 0
+        self._rlock = threading.RLock()
+        self._fd = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self.nivel == 0:
+            try:
+                self._tomar()
+            except BaseException:
+                self._rlock.release()
+                raise
+        self.nivel += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.nivel -= 1
+        if self.nivel == 0:
+            self._soltar()
+        self._rlock.release()
+
+    def _tomar(self) -> None:
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            return
+        while True:
+            try:
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+    def _soltar(self) -> None:
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class Transaccion:
+    """`with`: toma el BloqueoDatos y, en la entrada más externa, llama a al_tomar() (p. ej. releer lo que guardó otro proceso)."""
+
+    def __init__(self, bloqueo: BloqueoDatos, al_tomar):
+        self.bloqueo = bloqueo
+        self.al_tomar = al_tomar
+
+    def __enter__(self):
+        self.bloqueo.__enter__()
+        if self.bloqueo.nivel == 1:
+            try:
+                self.al_tomar()
+            except BaseException:
+                self.bloqueo.__exit__(None, None, None)
+                raise
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.bloqueo.__exit__(*exc)
+
+
+BLOQUEO = BloqueoDatos(LOCK_FILE)
+
+
+def firma_archivo(path: str):
+    """(mtime, tamaño, inodo) para notar si otro proceso reescribió el archivo; None si no existe."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def cargar_config() -> dict:
+    """Config local con los valores por defecto completados (claves nuevas no rompen configs viejas)."""
+    cfg = dict(CONFIG_DEFAULT)
+    cfg.update(load_json(CONFIG_FILE, {}))
+    return cfg
+
+
+MOTOR_OCR = MotorOCR(MOTOR_FILE)
+
+
+# === Tarifas y zonas (tarifas.json) ===
+class Tarifas:
+    """
+    Tabla de zonas y precios versionada, compilada una vez al iniciar:
+    - `cordones`: {cordón: [ciudades]}; el orden de las claves es el orden de las columnas.
+    - las ciudades de cada cordón alimentan el índice del matcher (ver Nomenclador).
+    - precios por vigencia: cada tramo {"desde": fecha, "precios": {...}} pisa sólo los cordones que
+      nombra; una fila se cobra con el tramo vigente en SU fecha (búsqueda binaria sobre `desde`).
+    - clientes: {cliente: {"alias": [...], "precios": [tramos]}}; los tramos de un cliente se aplican
+      sobre la tarifa general, y los alias permiten reconocer al cliente en el texto de la etiqueta.
+    """
+
+    def __init__(self, cfg: dict):
+        self.version = cfg.get("version", 0)
+        self.cordones = {c: [x.upper() for x in lista] for c, lista in cfg["cordones"].items()}
+        self.orden = list(self.cordones)
+        self._cordon_de = {ciudad: c for c, lista in self.cordones.items() for ciudad in lista}
+
+        # Tramos acumulativos ordenados por fecha; un vector por tramo (+0 para "cordon_no_identificado")
+        self.desde, self._vectores = [], []
+        vigentes = {c: 0 for c in self.orden}
+        for tramo in sorted(cfg["precios"], key=lambda t: t["desde"]):
+            vigentes.update(tramo["precios"])
+            self.desde.append(tramo["desde"])
+            self._vectores.append(np.array([vigentes[c] for c in self.orden] + [0], dtype=np.int64))
+
+        clientes = cfg.get("clientes") or {"bazar gadol": {}}
+        self.clientes = list(clientes)
+        self.cliente_defecto = cfg.get("cliente_por_defecto") or self.clientes[0]
+        if self.cliente_defecto not in self.clientes:
+            self.clientes.insert(0, self.cliente_defecto)
+
+        # Tramos por cliente = tarifa general en cada fecha + lo que el cliente pisa
+        self._tramos_cliente = {}
+        for cli, ccfg in clientes.items():
+            propios = sorted(ccfg.get("precios", []), key=lambda t: t["desde"])
+            if not propios:
+                continue
+            desde = sorted(set(self.desde) | {t["desde"] for t in propios})
+            vectores, pisados, k = [], {}, 0
+            for d in desde:
+                while k < len(propios) and propios[k]["desde"] <= d:
+                    pisados.update(propios[k]["precios"])
+                    k += 1
+                v = self._vectores[max(bisect.bisect_right(self.desde, d) - 1, 0)].copy()
+                for c, precio in pisados.items():
+                    if c in self.orden:
+                        v[self.orden.index(c)] = precio
+                vectores.append(v)
+            self._tramos_cliente[cli] = (desde, vectores)
+
+        alias = {a.upper(): cli for cli, ccfg in clientes.items() for a in ccfg.get("alias", [])}
+        self._alias_cliente = alias
+        self.patron_clientes = (
+            re.compile("|".join(re.escape(a) for a in sorted(alias, key=len, reverse=True))) if alias else None
+        )
+
+    @classmethod
+    def cargar(cls, path: str) -> "Tarifas":
+        cfg = load_json(path, None)
+        if not cfg:
+            cfg = {
+                "version": 0,
+                "cordones": CORDONES_BASE,
+                "precios": [{"desde": "2000-01-01", "precios": PRECIOS_BASE}],
+            }
+        return cls(cfg)
+
+    def cordon_de(self, ciudad: str) -> str:
+        return self._cordon_de.get((ciudad or "").upper(), "cordon_no_identificado")
+
+    def cliente_por_texto(self, texto: str):
+        """Cliente cuyo alias aparece en el texto de la etiqueta (remitente), o None."""
+        if not texto or self.patron_clientes is None:
+            return None
+        m = self.patron_clientes.search(texto.upper())
+        return self._alias_cliente[m.group(0)] if m else None
+
+    def vector(self, fecha: str = None, cliente: str = None) -> np.ndarray:
+        """
+        Precios (orden de columnas + 0 final) vigentes en `fecha` ISO para `cliente`
+        (tarifa general si el cliente no tiene precios propios); hoy si la fecha no es válida.
+        """
+        try:
+            fecha = date.fromisoformat(fecha).isoformat()
+        except (TypeError, ValueError):
+            fecha = date.today().isoformat()
+        desde, vectores = self._tramos_cliente.get(cliente, (self.desde, self._vectores))
+        i = bisect.bisect_right(desde, fecha) - 1
+        return vectores[max(i, 0)]
+
+    def matriz(self, fechas: list, cliente: str = None) -> np.ndarray:
+        """Precios por (fecha, cordón): una fila por fecha, cada una con el tramo vigente en esa fecha."""
+        if not fechas:
+            return np.zeros((0, len(self.orden) + 1), dtype=np.int64)
+        return np.vstack([self.vector(f, cliente) for f in fechas])
+
+    def precios_en(self, fecha: str = None) -> dict:
+        return dict(zip(self.orden, self.vector(fecha)[:-1].tolist()))
+
+
+def normalizar_nombre(texto: str) -> str:
+    """Mayúsculas sin tildes ni puntos, separadores como espacio: "José C. Paz" → "JOSE C PAZ"."""
+    texto = unicodedata.normalize("NFKD", (texto or "").upper())
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch)).replace(".", "")
+    return " ".join(re.sub(r"[^\w]+", " ", texto).split())
+
+
+# Código postal impreso en la etiqueta: CPA (B1824ABC) o "CP 1824" / "Código postal: 1824".
+# El CPA va pegado y con letra de provincia válida (no hay I ni O): "Mitre N 1850 DTO" no es un CP.
+# Un número de 4 cifras suelto no alcanza (domicilios, n° de envío): sólo confirma la ciudad de su línea.
+PATRON_CP = re.compile(
+    r"\b[A-HJ-NP-Z](?P<cpa>\d{4})[A-Z]{3}\b"
+    r"|\b(?:C\.? ?P\.?|C[OÓ]D(?:IGO)?\.? ?POSTAL) *:? *(?P<cp>\d{4})\b"
+)
+PATRON_CP_SUELTO = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+
+
+class Nomenclador:
+    """
+    Índice de nombres de lugar → zona de tarifas (y de ahí cordón), compilado una vez al iniciar:
+    - nivel 1: las zonas de tarifas.json (partidos), como siempre;
+    - nivel 2: localidades y barrios de localidades.json ("RAMOS MEJIA" → LA MATANZA NORTE).
+    Las claves son n-gramas de palabras normalizadas en un dict, así buscar en una línea cuesta una
+    consulta por cada (posición, largo) — la coincidencia más larga a la izquierda gana, y
+    "PARQUE AVELLANEDA" no se lee como AVELLANEDA. Se prefieren las líneas sin números (las que no
+    son un domicilio), porque muchos partidos y barrios también son nombres de calle: un barrio
+    suelto le gana a un partido en "Calle Moreno 200"; en líneas del mismo tipo gana el partido.
+    Los códigos postales van en rangos ordenados [desde, hasta] → zona: un CP se resuelve con una
+    búsqueda binaria sobre `desde`.
+    """
+
+    def __init__(self, tarifas: Tarifas, cfg: dict):
+        self.version = cfg.get("version", 0)
+        self._zona = {}       # nombre normalizado -> (nombre, zona)
+        self._nivel = {}      # nombre normalizado -> 1 | 2
+        for lista in tarifas.cordones.values():
+            for zona in lista:
+                self._agregar(zona, zona, 1)
+
+        ambiguos = set()
+        for zona, nombres in cfg.get("zonas", {}).items():
+            zona = zona.upper()
+            if tarifas.cordon_de(zona) == "cordon_no_identificado":
+                print(f"{LOCALIDADES_FILE}: zona {zona} no está en tarifas, se ignora")
+                continue
+            for nombre in nombres:
+                clave = normalizar_nombre(nombre)
+                previo = self._zona.get(clave)
+                if previo is not None and tarifas.cordon_de(previo[1]) != tarifas.cordon_de(zona):
+                    if self._nivel[clave] == 2:
+                        ambiguos.add(clave)
+                    continue
+                self._agregar(nombre.upper(), zona, 2)
+        for clave in ambiguos:
+            del self._zona[clave], self._nivel[clave]
+
+        self._tarifas = tarifas
+        self.max_palabras = max((c.count(" ") + 1 for c in self._zona), default=0)
+
+        self._cp_desde, self._cp_hasta, self._cp_zona = [], [], []
+        for desde, hasta, zona in sorted(cfg.get("codigos_postales", [])):
+            zona = zona.upper()
+            if tarifas.cordon_de(zona) == "cordon_no_identificado":
+                print(f"{LOCALIDADES_FILE}: zona {zona} del CP {desde} no está en tarifas, se ignora")
+                continue
+            if self._cp_hasta and desde <= self._cp_hasta[-1]:
+                print(f"{LOCALIDADES_FILE}: el rango de CP {desde}–{hasta} se solapa con el anterior, se ignora")
+                continue
+            self._cp_desde.append(int(desde))
+            self._cp_hasta.append(int(hasta))
+            self._cp_zona.append(zona)
+
+    def _agregar(self, nombre: str, zona: str, nivel: int) -> None:
+        clave = normalizar_nombre(nombre)
+        if clave and clave not in self._zona:
+            self._zona[clave] = (nombre, zona)
+            self._nivel[clave] = nivel
+
+    @classmethod
+    def cargar(cls, path: str, tarifas: Tarifas) -> "Nomenclador":
+        return cls(tarifas, load_json(path, None) or {})
+
+    @property
+    def claves(self) -> list:
+        """Nombres normalizados (para la búsqueda aproximada)."""
+        return list(self._zona)
+
+    def nombre(self, clave: str) -> str:
+        return self._zona[clave][0]
+
+    def cordon_de(self, nombre: str) -> str:
+        hallado = self._zona.get(normalizar_nombre(nombre))
+        return self._tarifas.cordon_de(hallado[1]) if hallado else "cordon_no_identificado"
+
+    def en_linea(self, linea: str):
+        """(nombre, nivel) de cada coincidencia de la línea, de izquierda a derecha y sin solaparse."""
+        palabras = normalizar_nombre(linea).split()
+        k = 0
+        while k < len(palabras):
+            for n in range(min(self.max_palabras, len(palabras) - k), 0, -1):
+                clave = " ".join(palabras[k:k + n])
+                if clave in self._zona:
+                    yield self._zona[clave][0], self._nivel[clave]
+                    k += n
+                    break
+            else:
+                k += 1
+
+    def zona_de_cp(self, numero: int):
+        i = bisect.bisect_right(self._cp_desde, numero) - 1
+        return self._cp_zona[i] if i >= 0 and numero <= self._cp_hasta[i] else None
+
+    def buscar_cp(self, lineas: list):
+        """
+        (índice de línea, CP, zona) del primer código postal explícito (CPA o rotulado) con zona
+        conocida, o None. Se saltean las líneas del remitente, que traen su propio CP.
+        """
+        for i, linea in enumerate(lineas):
+            linea = linea.upper()
+            if "REMITE" in linea:
+                continue
+            for m in PATRON_CP.finditer(linea):
+                numero = int(m.group("cpa") or m.group("cp"))
+                zona = self.zona_de_cp(numero)
+                if zona:
+                    return i, numero, zona
+        return None
+
+    def zonas_cp_en_linea(self, linea: str) -> set:
+        """Zonas de los números de 4 cifras de la línea ("BERNAL (1876)"), para desempatar."""
+        zonas = {self.zona_de_cp(int(n)) for n in PATRON_CP_SUELTO.findall(linea)}
+        zonas.discard(None)
+        return zonas
+
+    def buscar(self, lineas: list):
+        """
+        (índice de línea, nombre) del lugar reconocido, o None: primero las líneas sin números,
+        después el nivel (partido antes que barrio), después la primera línea. Las líneas del
+        remitente se saltean, como en buscar_cp: su ciudad no es la del envío.
+        """
+        mejor = None
+        for i, linea in enumerate(lineas):
+            if "REMITE" in linea.upper():
+                continue
+            hallados = list(self.en_linea(linea))
+            if not hallados:
+                continue
+            nombre, nivel = min(hallados, key=lambda h: h[1])  # el primer partido de la línea, si hay
+            orden = (any(ch.isdigit() for ch in linea), nivel, i)
+            if mejor is None or orden < mejor[0]:
+                mejor = (orden, i, nombre)
+        return mejor[1:] if mejor else None
+
+
+TARIFAS = Tarifas.cargar(TARIFAS_FILE)
+CORDONES = TARIFAS.cordones
+PRECIOS = TARIFAS.precios_en()  # precios de hoy; el orden de las claves es el de las columnas
+NOMENCLADOR = Nomenclador.cargar(LOCALIDADES_FILE, TARIFAS)
+
+
+# === Índice de fuentes ya procesadas ===
+class IndiceProcesados:
+    """
+    Índice persistente de imágenes ya ingresadas (clasificadas, pendientes o duplicadas), para que
+    volver a cargar las mismas fotos o el mismo ZIP no cueste OCR ni se facture dos veces.
+
+    La consulta es O(1): primero por firma (path, tamaño, mtime) sin leer el archivo; si la firma
+    es nueva se calcula el SHA-1 del contenido, que reconoce la misma foto en otra ruta
+    (p. ej. un ZIP re-extraído en otra carpeta o la foto reenviada por otro chofer).
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entradas = {}     # sha1 -> [path, size, mtime_ns, ts]
+        self._por_firma = {}    # (path, size, mtime_ns) -> sha1
+        self._hash_cache = {}   # firmas hasheadas en esta sesión y aún no registradas
+
+        raw = load_json(path, None)
+        self.existia = raw is not None
+        for h, (src, size, mtime, ts) in (raw or {}).get("entradas", {}).items():
+            self._entradas[h] = [src, size, mtime, ts]
+            self._por_firma[(src, size, mtime)] = h
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    @staticmethod
+    def _firma(path: str):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+    @staticmethod
+    def _sha1(path: str) -> str:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+        return h.hexdigest()
+
+    def _hash(self, firma) -> str:
+        with self._lock:
+            h = self._por_firma.get(firma) or self._hash_cache.get(firma)
+        if h is None:
+            h = self._sha1(firma[0])
+            with self._lock:
+                self._hash_cache[firma] = h
+        return h
+
+    def ya_procesado(self, path: str) -> bool:
+        try:
+            firma = self._firma(path)
+        except OSError:
+            return False
+        with self._lock:
+            if firma in self._por_firma:
+                return True
+        return self._hash(firma) in self._entradas
+
+    def registrar(self, path: str) -> None:
+        try:
+            firma = self._firma(path)
+        except OSError:
+            return
+        h = self._hash(firma)
+        with self._lock:
+            self._hash_cache.pop(firma, None)
+            if h not in self._entradas:
+                self._entradas[h] = [firma[0], firma[1], firma[2], datetime.now().isoformat(timespec="seconds")]
+            self._por_firma[firma] = h
+
+    def olvidar(self, paths) -> int:
+        """Quita del índice las entradas de esas rutas (p. ej. al resetear un día para reprocesarlo)."""
+        objetivo = {os.path.abspath(p) for p in paths if p}
+        with self._lock:
+            borrar = [h for h, e in self._entradas.items() if e[0] in objetivo]
+            for h in borrar:
+                src, size, mtime, _ = self._entradas.pop(h)
+                self._por_firma.pop((src, size, mtime), None)
+            # Firmas alternativas (misma foto en otra ruta) que apuntaban a hashes borrados
+            for f in [f for f, h in self._por_firma.items() if h not in self._entradas]:
+                del self._por_firma[f]
+        return len(borrar)
+
+    def guardar(self) -> None:
+        with self._lock:
+            save_json(self.path, {"version": self.VERSION, "entradas": dict(self._entradas)}, indent=None)
+
+
+# === Fechas ===
+# Los datos se guardan por fecha real (ISO "AAAA-MM-DD"); el día de la semana se deriva.
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+
+def es_fecha_iso(clave: str) -> bool:
+    try:
+        date.fromisoformat(clave)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def dia_semana(fecha_iso: str) -> str:
+    return DIAS_SEMANA[date.fromisoformat(fecha_iso).weekday()]
+
+
+def etiqueta_fecha(fecha_iso: str) -> str:
+    """ "2025-10-06" -> "Lunes 06/10/2025" (lo que se muestra en selectores y tablas)."""
+    f = date.fromisoformat(fecha_iso)
+    return f"{DIAS_SEMANA[f.weekday()]} {f.strftime('%d/%m/%Y')}"
+
+
+def fecha_de_etiqueta(etiqueta: str) -> str:
+    """Inversa de etiqueta_fecha."""
+    return datetime.strptime(etiqueta.rsplit(" ", 1)[-1], "%d/%m/%Y").date().isoformat()
+
+
+def fechas_semana(ref: date, n_dias: int = 6) -> list:
+    """Fechas ISO de lunes a sábado (por defecto) de la semana de `ref`."""
+    lunes = ref - timedelta(days=ref.weekday())
+    return [(lunes + timedelta(days=i)).isoformat() for i in range(n_dias)]
+
+
+def fechas_en_rango(fechas_ordenadas: list, desde: str, hasta: str) -> list:
+    """Índice de fechas: sublista [desde, hasta] (inclusive) de una lista ordenada, por búsqueda binaria."""
+    i = bisect.bisect_left(fechas_ordenadas, desde)
+    j = bisect.bisect_right(fechas_ordenadas, hasta)
+    return fechas_ordenadas[i:j]
+
+
+def semana_iso(fecha) -> str:
+    anio, sem, _ = fecha.isocalendar()
+    return f"{anio}-W{sem:02d}"
+
+
+def migrar_a_fechas(data: dict, subregs: dict, hoy: date):
+    """
+    Convierte el esquema viejo por día de la semana ("Lunes".."Viernes") al esquema por fecha real.
+    - Cada fila detallada va a la fecha de su `ts`; sin ts, a ese día de la semana de la semana de `hoy`.
+    - Los conteos de cada día viejo van a la fecha más frecuente entre sus filas (o a ese día de esta semana).
+    Devuelve (data, subregs, cambió).
+    """
+    if all(es_fecha_iso(k) for k in list(data) + list(subregs)):
+        return data, subregs, False
+
+    def fecha_del_dia(nombre: str) -> str:
+        idx = DIAS_SEMANA.index(nombre) if nombre in DIAS_SEMANA else hoy.weekday()
+        return (hoy - timedelta(days=hoy.weekday() - idx)).isoformat()
+
+    nuevo_subregs = defaultdict(list)
+    destino_dia = {}
+    for clave, items in subregs.items():
+        if es_fecha_iso(clave):
+            nuevo_subregs[clave].extend(items)
+            continue
+        fechas = Counter()
+        for s in items:
+            try:
+                f = datetime.fromisoformat(s.get("ts") or "").date().isoformat()
+            except ValueError:
+                f = fecha_del_dia(clave)
+            nuevo_subregs[f].append(s)
+            fechas[f] += 1
+        destino_dia[clave] = fechas.most_common(1)[0][0] if fechas else fecha_del_dia(clave)
+
+    nuevo_data = {}
+    for clave, vals in data.items():
+        f = clave if es_fecha_iso(clave) else destino_dia.get(clave) or fecha_del_dia(clave)
+        dst = nuevo_data.setdefault(f, {})
+        for c, n in vals.items():
+            dst[c] = dst.get(c, 0) + n
+
+    # Días vacíos del esquema viejo no se arrastran
+    nuevo_data = {f: v for f, v in nuevo_data.items() if v}
+    return nuevo_data, dict(nuevo_subregs), True
+
+
+# === Tarifas y agregación ===
+# Única fuente de los totales: conteos como matriz fechas × cordones y precios como matriz del mismo
+# tamaño (el tramo vigente en cada fecha); Importe = suma por fila de conteos ⊙ precios.
+# La usan la tabla, el Excel resumen, el historial y el detallado.
+def matriz_conteos(data: dict, fechas: list) -> np.ndarray:
+    """Matriz (fechas × cordones de PRECIOS) con los conteos de `data` ({fecha: {cordón: n}})."""
+    col = {c: j for j, c in enumerate(PRECIOS)}
+    m = np.zeros((len(fechas), len(col)), dtype=np.int64)
+    for i, f in enumerate(fechas):
+        for c, n in data.get(f, {}).items():
+            j = col.get(c)
+            if j is not None:
+                m[i, j] = n
+    return m
+
+
+def indexar_clientes(subregs: dict) -> dict:
+    """Índice {cliente: {fecha: Counter(cordón)}} de las filas detalladas (sin Cliente → cliente por defecto)."""
+    idx = defaultdict(lambda: defaultdict(Counter))
+    for fecha, items in subregs.items():
+        for s in items:
+            idx[s.get("Cliente") or TARIFAS.cliente_defecto][fecha][s.get("Cordon")] += 1
+    return idx
+
+
+def conteos_por_cliente(data: dict, indice: dict) -> dict:
+    """
+    {cliente: {fecha: {cordón: n}}}. Al cliente por defecto le corresponde `data` menos lo de los
+    demás clientes, así los conteos viejos sin fila detallada siguen sumando (a la tarifa general).
+    """
+    defecto = TARIFAS.cliente_defecto
+    out = {
+        cli: {f: dict(cnt) for f, cnt in por_fecha.items()}
+        for cli, por_fecha in indice.items() if cli != defecto
+    }
+    resto = {}
+    for f, vals in data.items():
+        r = Counter(vals)
+        for por_fecha in out.values():
+            r.subtract(por_fecha.get(f, {}))
+        resto[f] = {c: n for c, n in r.items() if n > 0}
+    out[defecto] = resto
+    return out
+
+
+def resumir(data: dict, fechas: list, por_cliente: dict = None) -> dict:
+    """
+    Totales por fecha y de todo el período, cada fecha con sus precios vigentes:
+    {fechas, cordones, conteos (matriz), paquetes (por fecha), importes (por fecha), total_paquetes, total_importe}
+    Con `por_cliente` ({cliente: data}) el importe de cada cliente se calcula con su tarifa.
+    """
+    m = matriz_conteos(data, fechas)
+    paquetes = m.sum(axis=1)
+    if por_cliente is None:
+        importes = np.einsum("ij,ij->i", m, TARIFAS.matriz(fechas)[:, :-1])
+    else:
+        importes = np.zeros(len(fechas), dtype=np.int64)
+        for cli, data_cli in por_cliente.items():
+            importes += np.einsum(
+                "ij,ij->i", matriz_conteos(data_cli, fechas), TARIFAS.matriz(fechas, cli)[:, :-1]
+            )
+    return {
+        "fechas": list(fechas),
+        "cordones": list(PRECIOS),
+        "conteos": m,
+        "paquetes": paquetes,
+        "importes": importes,
+        "total_paquetes": int(paquetes.sum()),
+        "total_importe": int(importes.sum()),
+    }
+
+
+# === Filas del detallado ===
+class FilaDetalle:
+    """
+    Una etiqueta del detallado. Con __slots__ y los valores que se repiten (cordón, ciudad, cliente,
+    ts) internados ocupa una fracción de un dict; se lee igual que un dict (fila["Cordon"],
+    fila.get("Envio")) y a_dict() da la forma JSON de siempre.
+    Confianza es el puntaje de la clasificación automática (None en las manuales y las viejas) y
+    Revisar marca las aceptadas con duda hasta que alguien las confirma.
+    """
+
+    __slots__ = ("Cordon", "Ciudad", "Subregión", "Src", "Manual", "ts", "Envio", "Cliente",
+                 "Confianza", "Revisar")
+
+    def __init__(self, Cordon: str, Ciudad: str = "", Subregión: str = "", Src: str = "",
+                 Manual: bool = False, ts: str = "", Envio: str = "", Cliente: str = "",
+                 Confianza: float = None, Revisar: bool = False):
+        self.Cordon = sys.intern(Cordon or "")
+        self.Ciudad = sys.intern(Ciudad or "")
+        self.Subregión = Subregión or ""
+        self.Src = Src or ""
+        self.Manual = bool(Manual)
+        self.ts = sys.intern(ts or "")
+        self.Envio = Envio or ""
+        self.Cliente = sys.intern(Cliente or "")
+        self.Confianza = Confianza
+        self.Revisar = bool(Revisar)
+
+    def __getitem__(self, clave: str):
+        try:
+            return getattr(self, clave)
+        except AttributeError:
+            raise KeyError(clave) from None
+
+    def get(self, clave: str, default=None):
+        return getattr(self, clave, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def a_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __eq__(self, otra) -> bool:
+        return isinstance(otra, FilaDetalle) and all(getattr(self, k) == getattr(otra, k) for k in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"FilaDetalle({self.a_dict()!r})"
+
+
+def json_filas(o):
+    """`default` de json.dumps: FilaDetalle se guarda como su dict."""
+    if isinstance(o, FilaDetalle):
+        return o.a_dict()
+    raise TypeError(f"{type(o).__name__} no es serializable")
+
+
+# === Historial de semanas archivadas ===
+
+class Historial:
+    """
+    Semanas cerradas, particionadas por semana ISO en HIST_DIR (un .json.gz compacto por semana).
+    El índice guarda los totales de cada semana, así que los totales entre semanas se calculan sin
+    abrir ninguna partición; el detalle de una semana se carga recién cuando se lo pide.
+    """
+
+    INDICE = "indice.json"
+
+    def __init__(self, carpeta: str = HIST_DIR):
+        self.carpeta = carpeta
+        self._indice = None     # se carga al primer uso
+        self._cache = {}        # semana -> partición ya leída
+
+    @property
+    def indice(self) -> dict:
+        if self._indice is None:
+            self._indice = load_json(os.path.join(self.carpeta, self.INDICE), {})
+        return self._indice
+
+    def _archivo(self, semana: str) -> str:
+        return os.path.join(self.carpeta, f"semana_{semana}.json.gz")
+
+    def semanas(self) -> list:
+        return sorted(self.indice)
+
+    def cargar(self, semana: str) -> dict:
+        """Partición {semana, data, subregs} de una semana archivada (lazy, cacheada)."""
+        if semana not in self._cache:
+            try:
+                with gzip.open(self._archivo(semana), "rt", encoding="utf-8") as f:
+                    self._cache[semana] = json.load(f)
+            except FileNotFoundError:
+                self._cache[semana] = {"semana": semana, "data": {}, "subregs": {}}
+        return self._cache[semana]
+
+    def archivar(self, semana: str, data: dict, subregs: dict) -> None:
+        """Agrega la semana al historial (si ya había una partición para esa semana, se suman)."""
+        os.makedirs(self.carpeta, exist_ok=True)
+        part = self.cargar(semana) if semana in self.indice else {"semana": semana, "data": {}, "subregs": {}}
+
+        for dia, vals in data.items():
+            dst = part["data"].setdefault(dia, {})
+            for c, n in vals.items():
+                dst[c] = dst.get(c, 0) + n
+        for dia, items in subregs.items():
+            part["subregs"].setdefault(dia, []).extend(items)
+
+        texto = json.dumps(part, ensure_ascii=False, separators=(",", ":"), default=json_filas)
+        escribir_atomico(self._archivo(semana), gzip.compress(texto.encode("utf-8")))
+        self._cache[semana] = part
+
+        por_cordon = Counter()
+        for vals in part["data"].values():
+            por_cordon.update(vals)
+        self.indice[semana] = {
+            "archivada": datetime.now().isoformat(timespec="seconds"),
+            "por_cordon": dict(por_cordon),
+            "paquetes": sum(por_cordon.values()),
+            "importe": resumir(
+                part["data"], sorted(part["data"]),
+                conteos_por_cliente(part["data"], indexar_clientes(part["subregs"])),
+            )["total_importe"],
+            "filas": sum(len(v) for v in part["subregs"].values()),
+        }
+        save_json(os.path.join(self.carpeta, self.INDICE), self.indice)
+
+    def totales(self, semanas=None) -> dict:
+        """Suma de paquetes/importe/cordones de las semanas pedidas (todas por defecto), sólo con el índice."""
+        tot = {"por_cordon": Counter(), "paquetes": 0, "importe": 0}
+        for sem in (semanas if semanas is not None else self.semanas()):
+            e = self.indice.get(sem)
+            if not e:
+                continue
+            tot["por_cordon"].update(e["por_cordon"])
+            tot["paquetes"] += e["paquetes"]
+            tot["importe"] += e["importe"]
+        return tot
+
+
+# === ZIP utils ===
+def extraer_zip(path: str, destino: str) -> list:
+    """Extrae el ZIP en `destino` y devuelve las rutas de las imágenes que contenía."""
+    os.makedirs(destino, exist_ok=True)
+    with zipfile.ZipFile(path, "r") as z:
+        z.extractall(destino)
+    return [
+        os.path.join(r, f)
+        for r, _, fs in os.walk(destino)
+        for f in fs
+        if f.lower().endswith(EXT_IMAGENES)
+    ]
+
+
+def imagenes_en_zip(path: str) -> int:
+    """Cuántas imágenes trae el ZIP, leyendo sólo su directorio (sin extraer); 0 si no se puede abrir."""
+    try:
+        with zipfile.ZipFile(path, "r") as z:
+            return sum(1 for n in z.namelist() if n.lower().endswith(EXT_IMAGENES))
+    except (OSError, zipfile.BadZipFile):
+        return 0
 
 
 # === OCR utils ===
 def identificar_cordon_por_ciudad(texto: str):
     """
-    Busca en el texto OCR una ciudad y, si la encuentra, devuelve (cordón, ciudad, subregión).
+    Busca en el texto OCR el código postal o una ciudad (partido, o localidad/barrio del
+    nomenclador) y, si la encuentra, devuelve (cordón, ciudad, subregión).
     La subregión se toma como la línea siguiente a la ciudad, si existe.
     """
     lineas = texto.splitlines()
+    hallada = resolver_lugar(lineas, difusa=False)
+    if hallada is None:
+        return "cordon_no_identificado", None, None
+    i, ciudad, _ = hallada
+    subregion = lineas[i + 1].strip() if i + 1 < len(lineas) else ""
+    return NOMENCLADOR.cordon_de(ciudad), ciudad, subregion
+
+
+# === Confianza de la clasificación ===
+UMBRAL_CONFIANZA = {"auto": 0.80, "revisar": 0.50}  # se pisa con config.json (confianza_auto / _revisar)
+SIMILITUD_MINIMA = 0.80  # coincidencia aproximada (difflib) para aceptar una ciudad mal leída
+DESACUERDO_CP = 0.6      # similitud cuando el CP y la ciudad leída apuntan a cordones distintos
+
+
+def configurar_confianza(cfg: dict) -> None:
+    UMBRAL_CONFIANZA["auto"] = float(cfg.get("confianza_auto", UMBRAL_CONFIANZA["auto"]))
+    UMBRAL_CONFIANZA["revisar"] = float(cfg.get("confianza_revisar", UMBRAL_CONFIANZA["revisar"]))
+
+
+def decidir_por_confianza(confianza: float) -> str:
+    """"aceptar" (se cuenta), "revisar" (se cuenta marcada) o "pendiente" (confirmación manual)."""
+    if confianza >= UMBRAL_CONFIANZA["auto"]:
+        return "aceptar"
+    if confianza >= UMBRAL_CONFIANZA["revisar"]:
+        return "revisar"
+    return "pendiente"
+
+
+@functools.lru_cache(maxsize=20000)
+def _parecida(ventana: str):
+    """
+    (clave, similitud) del nombre del nomenclador más parecido a la ventana, o None. Con caché: las
+    mismas palabras ("RECIBE", "DOMICILIO", calles) se repiten en casi todas las etiquetas y difflib
+    contra todo el nomenclador es lo más caro de clasificar un texto; acotada porque la ventana y la
+    API corren días y cada basura nueva del OCR es otra entrada.
+    """
+    for clave in difflib.get_close_matches(ventana, NOMENCLADOR.claves, n=1, cutoff=SIMILITUD_MINIMA):
+        return clave, difflib.SequenceMatcher(None, ventana, clave).ratio()
+    return None
+
+
+def recargar_nomenclador() -> None:
+    """
+    Relee localidades.json (sobre las tarifas ya cargadas) y vacía la caché de _parecida, así una
+    localidad o barrio recién agregado cuenta sin reiniciar. Las tarifas no se recargan: los
+    cordones son las columnas de la ventana.
+    """
+    global NOMENCLADOR
+    NOMENCLADOR = Nomenclador.cargar(LOCALIDADES_FILE, TARIFAS)
+    _parecida.cache_clear()
+
+
+def buscar_ciudad(lineas: list):
+    """
+    (índice de línea, ciudad, similitud) de la primera ciudad conocida en las líneas, o None.
+    Primero la búsqueda exacta en el nomenclador (similitud 1.0); si no hay, la ventana de 1 a 3
+    palabras más parecida a algún nombre (difflib) por encima de SIMILITUD_MINIMA, para lecturas
+    como "LANUZ".
+    """
+    hallada = NOMENCLADOR.buscar(lineas)
+    if hallada is not None:
+        return hallada[0], hallada[1], 1.0
+
+    mejor = None
     for i, linea in enumerate(lineas):
-        uline = linea.upper().strip()
-        for cordon, ciudades in CORDONES.items():
-            for ciudad in ciudades:
-                if ciudad in uline:
-                    subregion = lineas[i + 1].strip() if i + 1 < len(lineas) else ""
-                    return cordon, ciudad, subregion
-    return "cordon_no_identificado", None, None
+        if "REMITE" in linea.upper():
+            continue  # como en el nomenclador: la ciudad del remitente no es la del envío
+        palabras = [p for p in normalizar_nombre(linea).split() if not p.isdigit()]
+        for n in (1, 2, 3):
+            for k in range(len(palabras) - n + 1):
+                ventana = " ".join(palabras[k:k + n])
+                if len(ventana) < 4:
+                    continue
+                parecida = _parecida(ventana)
+                if parecida is not None and (mejor is None or parecida[1] > mejor[2]):
+                    mejor = (i, NOMENCLADOR.nombre(parecida[0]), parecida[1])
+    return mejor
+
+
+def resolver_lugar(lineas: list, difusa: bool = True):
+    """
+    (índice de línea, ciudad, similitud) combinando código postal y ciudad, o None:
+    - CP explícito que coincide en cordón con la ciudad leída: la ciudad, con similitud 1.0 aunque
+      se haya leído aproximada (el CP la confirma);
+    - CP explícito sin ciudad: la zona del CP (1.0); si la ciudad dice otro cordón manda el CP,
+      con similitud DESACUERDO_CP para que la etiqueta quede a revisar, salvo que la ciudad sea
+      exacta y el CP venga en una línea de domicilio (con más números): ahí manda la ciudad;
+    - sin CP explícito: la ciudad; una aproximada se confirma si su misma línea trae un número de
+      4 cifras cuyo CP es del mismo cordón ("BERNAI (1876)").
+    """
+    if difusa:
+        hallada = buscar_ciudad(lineas)
+    else:
+        exacta = NOMENCLADOR.buscar(lineas)
+        hallada = (exacta[0], exacta[1], 1.0) if exacta else None
+    cp = NOMENCLADOR.buscar_cp(lineas)
+
+    if cp is not None:
+        i_cp, _, zona = cp
+        if hallada is None:
+            return i_cp, zona, 1.0
+        if NOMENCLADOR.cordon_de(hallada[1]) == NOMENCLADOR.cordon_de(zona):
+            return hallada[0], hallada[1], 1.0
+        if hallada[2] == 1.0 and any(ch.isdigit() for ch in PATRON_CP.sub("", lineas[i_cp].upper())):
+            return hallada
+        return i_cp, zona, DESACUERDO_CP
+
+    if hallada is not None and hallada[2] < 1.0:
+        i, ciudad, _ = hallada
+        cordon = NOMENCLADOR.cordon_de(ciudad)
+        if any(NOMENCLADOR.cordon_de(z) == cordon for z in NOMENCLADOR.zonas_cp_en_linea(lineas[i])):
+            return i, ciudad, 1.0
+    return hallada
+
+
+def _agrupar_lineas(datos) -> list:
+    """
+    Agrupa las palabras de pytesseract.image_to_data en líneas de texto.
+    Devuelve [ {"texto": str, "caja": (x0, y0, x1, y1), "conf": 0–1}, ... ] en orden de lectura;
+    `conf` es el promedio de la confianza que Tesseract da a cada palabra de la línea.
+    """
+    lineas = {}
+    confs = datos.get("conf") or []
+    for i, palabra in enumerate(datos.get("text", [])):
+        palabra = (palabra or "").strip()
+        if not palabra:
+            continue
+        clave = (datos["block_num"][i], datos["par_num"][i], datos["line_num"][i])
+        x0, y0 = datos["left"][i], datos["top"][i]
+        x1, y1 = x0 + datos["width"][i], y0 + datos["height"][i]
+        conf = float(confs[i]) if i < len(confs) else -1.0
+        if clave not in lineas:
+            lineas[clave] = {"palabras": [palabra], "caja": [x0, y0, x1, y1], "confs": []}
+        else:
+            l = lineas[clave]
+            l["palabras"].append(palabra)
+            c = l["caja"]
+            l["caja"] = [min(c[0], x0), min(c[1], y0), max(c[2], x1), max(c[3], y1)]
+        if conf >= 0:
+            lineas[clave]["confs"].append(conf)
+    return [
+        {"texto": " ".join(l["palabras"]), "caja": tuple(l["caja"]),
+         "conf": sum(l["confs"]) / len(l["confs"]) / 100 if l["confs"] else 0.0}
+        for _, l in sorted(lineas.items())
+    ]
 
 
-def ocr_con_rotaciones(img) -> str:
+def ocr_con_rotaciones_datos(img):
     """
-    Ejecuta OCR con rotaciones 0/90/180/270 y devuelve el primer resultado no vacío.
+    Ejecuta OCR con rotaciones 0/90/180/270 usando image_to_data (cajas por palabra), a pedido:
+    genera (texto, imagen_rotada, lineas) de cada rotación con texto, así quien consume corta
+    cuando le alcanza. Las cajas permiten releer zonas puntuales sin repetir el OCR de la página.
     """
     for ang in (0, 90, 180, 270):
-        txt = pytesseract.image_to_string(img.rotate(ang, expand=True), lang="eng")
+        rot = img.rotate(ang, expand=True)
+        datos = pytesseract.image_to_data(rot, lang="eng", output_type=pytesseract.Output.DICT)
+        lineas = _agrupar_lineas(datos)
+        txt = "\n".join(l["texto"] for l in lineas)
         if txt.strip():
-            return txt
-    return ""
+            yield txt, rot, lineas
+
+
+def ocr_clasificar(img) -> dict:
+    """
+    OCR con rotaciones buscando el CP / la ciudad (resolver_lugar), con un puntaje de confianza 0–1:
+        confianza = confianza OCR de la línea de la ciudad × similitud (1.0 exacta o confirmada por CP)
+                    × acuerdo entre rotaciones (peso de las que dan el mismo cordón / total)
+    Una lectura exacta y nítida corta en la primera rotación (el costo de siempre); si no, se
+    prueban las demás y se queda la mejor, así las dudosas se contrastan entre sí.
+    Devuelve {texto, imagen, lineas, indice, ciudad, cordon, confianza}; ciudad None si no hubo.
+    """
+    candidatos, primero = [], None
+    for texto, rot, lineas in ocr_con_rotaciones_datos(img):
+        hallada = resolver_lugar([l["texto"] for l in lineas])
+        if hallada is None:
+            primero = primero or (texto, rot, lineas)
+            continue
+        i, ciudad, sim = hallada
+        peso = lineas[i]["conf"] * sim
+        candidatos.append({"texto": texto, "imagen": rot, "lineas": lineas, "indice": i, "ciudad": ciudad,
+                           "cordon": NOMENCLADOR.cordon_de(ciudad), "peso": peso})
+        if sim == 1.0 and lineas[i]["conf"] >= UMBRAL_CONFIANZA["auto"]:
+            break
+
+    if not candidatos:
+        texto, rot, lineas = primero or ("", img, [])
+        return {"texto": texto, "imagen": rot, "lineas": lineas, "indice": None, "ciudad": None,
+                "cordon": "cordon_no_identificado", "confianza": 0.0}
+
+    mejor = max(candidatos, key=lambda c: c["peso"])
+    total = sum(c["peso"] for c in candidatos)
+    acuerdo = sum(c["peso"] for c in candidatos if c["cordon"] == mejor["cordon"]) / total if total else 1.0
+    mejor["confianza"] = round(mejor["peso"] * acuerdo, 3)
+    return mejor
+
+
+def ocr_subregion_dirigida(img, lineas: list, idx: int) -> str:
+    """
+    Relee en alta calidad sólo la franja siguiente a la línea `idx`, donde apareció la ciudad
+    (calle/subregión). Usa la caja de la línea siguiente si el OCR la detectó cerca;
+    si no, estima una franja de la misma altura justo debajo. Devuelve "" si no hay lectura útil.
+    """
+
+    x0, y0, x1, y1 = lineas[idx]["caja"]
+    alto = max(y1 - y0, 8)
+    ancho_img, alto_img = img.size
+
+    sig = lineas[idx + 1]["caja"] if idx + 1 < len(lineas) else None
+    if sig and y1 <= sig[1] <= y1 + 3 * alto:
+        caja = (sig[0], sig[1], sig[2], sig[3])
+    else:
+        caja = (x0, y1, ancho_img, y1 + int(alto * 1.6))
+
+    pad = alto // 3
+    caja = (
+        max(0, caja[0] - pad), max(0, caja[1] - pad),
+        min(ancho_img, caja[2] + pad), min(alto_img, caja[3] + pad),
+    )
+    if caja[2] - caja[0] < 4 or caja[3] - caja[1] < 4:
+        return ""
+
+    recorte = ImageOps.autocontrast(img.crop(caja).convert("L"))
+    # Tesseract rinde mejor con letras de ~30px de alto
+    escala = max(1, min(4, round(32 / alto)))
+    if escala > 1:
+        recorte = recorte.resize((recorte.width * escala, recorte.height * escala), Image.LANCZOS)
+
+    txt = pytesseract.image_to_string(recorte, lang="eng", config="--psm 7").strip()
+    return txt if sum(ch.isalnum() for ch in txt) >= 3 else ""
+
+
+# === QR / código de barras (etiquetas Flex) ===
+def parsear_payload_envio(payload: str):
+    """
+    Interpreta el contenido del QR de una etiqueta Flex.
+    Mercado Libre codifica un JSON tipo {"id": "4123...", "sender_id": ..., ...}; si no es JSON
+    se busca un número de envío suelto. Devuelve (id_envio, texto_extra) donde texto_extra son los
+    valores de texto del payload (a veces traen localidad) para intentar clasificar sin OCR.
+    """
+    try:
+        obj = json.loads(payload)
+    except ValueError:
+        obj = None
+
+    if isinstance(obj, dict):
+        envio = obj.get("id") or obj.get("shipment_id") or obj.get("envio")
+        extra = "\n".join(str(v) for v in obj.values() if isinstance(v, str))
+        return (str(envio) if envio else None), extra
+
+    m = re.search(r"\b(\d{10,12})\b", payload)
+    return (m.group(1) if m else None), payload
+
+
+def leer_envio(img):
+    """
+    Intenta decodificar el QR/código de barras de la etiqueta (si pyzbar está instalado).
+    Devuelve (id_envio, texto_extra) o (None, "") si no hay código legible.
+    """
+    if not ZBAR:
+        return None, ""
+    try:
+        codigos = pyzbar.decode(img) or pyzbar.decode(ImageOps.grayscale(img))
+    except Exception as e:
+        print("Error leyendo código:", e)
+        return None, ""
+
+    for c in codigos:
+        envio, extra = parsear_payload_envio(c.data.decode("utf-8", "replace"))
+        if envio:
+            return envio, extra
+    return None, ""
+
+
+# === Aprendizaje de confirmaciones manuales ===
+class Aprendizaje:
+    """
+    Lo aprendido de cada pendiente confirmado a mano (texto OCR → cordón elegido), para que las
+    lecturas fallidas que se repiten se resuelvan solas la próxima vez:
+    - alias (palabra → cordón): la palabra apareció en ALIAS_MIN confirmaciones o más, todas del
+      mismo cordón (una palabra genérica como "CALLE" o "PISO" termina en varios cordones y queda
+      afuera; la lectura fallida que más se repite, en cambio, es justo el alias que se busca);
+    - Bayes ingenuo multinomial sobre las palabras: entrenar es sumar conteos y predecir es una suma
+      de logaritmos por cordón; se usa recién con NB_MIN confirmaciones.
+    Los conteos se guardan en `path`; con el BLOQUEO tomado se releen si otro proceso aprendió.
+    """
+
+    ALIAS_MIN = 3
+    NB_MIN = 20
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._leer()
+
+    def _leer(self) -> None:
+        raw = load_json(self.path, {})
+        self.docs = Counter(raw.get("docs", {}))                                      # cordón -> confirmaciones
+        self.palabras = {p: Counter(c) for p, c in raw.get("palabras", {}).items()}   # palabra -> {cordón: n}
+        self._por_cordon = Counter()                                                  # cordón -> palabras vistas
+        for conteo in self.palabras.values():
+            self._por_cordon.update(conteo)
+        self._firma = firma_archivo(self.path)
+        self._sucio = False
+
+    @staticmethod
+    def palabras_de(texto: str) -> set:
+        return {p for p in normalizar_nombre(texto).split() if len(p) >= 4 and not p.isdigit()}
+
+    def sincronizar(self) -> None:
+        with self._lock:
+            if not self._sucio and firma_archivo(self.path) != self._firma:
+                self._leer()
+
+    def aprender(self, texto: str, cordon: str) -> None:
+        palabras = self.palabras_de(texto)
+        if not palabras:
+            return
+        with self._lock:
+            self.docs[cordon] += 1
+            for p in palabras:
+                self.palabras.setdefault(p, Counter())[cordon] += 1
+            self._por_cordon[cordon] += len(palabras)
+            self._sucio = True
+
+    def guardar(self) -> None:
+        with self._lock:
+            if self._sucio:
+                save_json(self.path, {"docs": self.docs, "palabras": self.palabras}, indent=None)
+                self._firma = firma_archivo(self.path)
+                self._sucio = False
+
+    def _es_alias(self, palabra: str):
+        """(cordón, confirmaciones) si la palabra vale como alias, o None."""
+        conteo = self.palabras.get(palabra)
+        if conteo is None or len(conteo) != 1:
+            return None
+        (cordon, n), = conteo.items()
+        return (cordon, n) if n >= self.ALIAS_MIN else None
+
+    def predecir(self, texto: str):
+        """(cordón, confianza, "alias" | "bayes") para un texto sin ciudad reconocida, o None."""
+        palabras = self.palabras_de(texto)
+        with self._lock:
+            conocidas = [p for p in palabras if p in self.palabras]
+            if not conocidas:
+                return None
+
+            alias = [a for a in map(self._es_alias, conocidas) if a]
+            if alias:
+                mejor = max(alias, key=lambda a: a[1])
+                return mejor[0], round(mejor[1] / (mejor[1] + 1), 3), "alias"
+
+            total = sum(self.docs.values())
+            if total < self.NB_MIN or len(self.docs) < 2:
+                return None
+            vocab = len(self.palabras)
+            puntajes = {}
+            for cordon, n in self.docs.items():
+                den = self._por_cordon[cordon] + vocab
+                puntajes[cordon] = math.log(n / total) + sum(
+                    math.log((self.palabras[p][cordon] + 1) / den) for p in conocidas
+                )
+            tope = max(puntajes.values())
+            pesos = {c: math.exp(v - tope) for c, v in puntajes.items()}
+            cordon = max(pesos, key=pesos.get)
+            # Probabilidad por encima del azar (1/k → 0, 1 → 1), atenuada mientras hay pocas confirmaciones
+            azar = 1 / len(pesos)
+            confianza = (pesos[cordon] / sum(pesos.values()) - azar) / (1 - azar)
+            confianza *= min(1.0, total / (2 * self.NB_MIN))
+            return cordon, round(confianza, 3), "bayes"
+
+
+def clasificar_imagen(path: str, envios_conocidos=(), aprendizaje: Aprendizaje = None) -> dict:
+    """
+    Clasifica una etiqueta. Primero intenta el QR (rápido y exacto): si el envío ya fue
+    registrado se marca duplicado sin hacer OCR; si el payload trae la localidad se evita el OCR.
+    Si no, cae al OCR con rotaciones + relectura dirigida del domicilio; sin motor OCR
+    (MOTOR_OCR en "solo QR") la etiqueta queda sin identificar, es decir pendiente.
+    Sin ciudad ni CP reconocidos se consulta lo aprendido de las confirmaciones (`aprendizaje`).
+    Devuelve {path, cordon, ciudad, subregion, envio, duplicado, texto, confianza, decision};
+    `decision` sale de decidir_por_confianza (la localidad del QR vale confianza 1).
+    """
+    img = Image.open(path)
+    envio, extra = leer_envio(img)
+    res = {"path": path, "cordon": "cordon_no_identificado", "ciudad": None,
+           "subregion": None, "envio": envio, "duplicado": False, "texto": extra,
+           "confianza": 0.0, "decision": "pendiente"}
+
+    if envio and envio in envios_conocidos:
+        res["duplicado"] = True
+        return res
+
+    cordon, ciudad, sub = identificar_cordon_por_ciudad(extra) if extra else ("cordon_no_identificado", None, None)
+    confianza = 1.0 if ciudad else 0.0
+    if not ciudad and MOTOR_OCR.disponible():
+        ocr = ocr_clasificar(img)
+        cordon, ciudad, confianza = ocr["cordon"], ocr["ciudad"], ocr["confianza"]
+        if ciudad:
+            lineas, i = ocr["lineas"], ocr["indice"]
+            sub = lineas[i + 1]["texto"].strip() if i + 1 < len(lineas) else ""
+            # Relectura dirigida de la línea siguiente (Domicilio) sobre la imagen ya rotada; se pasa
+            # el índice de la línea de la ciudad, no su texto, que puede repetirse más arriba
+            sub = ocr_subregion_dirigida(ocr["imagen"], lineas, i) or sub
+        res["texto"] = "\n".join(t for t in (extra, ocr["texto"]) if t)
+
+    if not ciudad and aprendizaje is not None and res["texto"]:
+        aprendido = aprendizaje.predecir(res["texto"])
+        if aprendido is not None:
+            cordon, confianza, _ = aprendido
+
+    decision = decidir_por_confianza(confianza) if cordon in CORDONES else "pendiente"
+    res.update(cordon=cordon, ciudad=ciudad, subregion=sub, confianza=confianza, decision=decision)
+    return res
+
+
+def clasificar_texto(path: str, texto: str, aprendizaje: Aprendizaje = None) -> dict:
+    """
+    Vuelve a clasificar un pendiente sólo con su texto OCR guardado (sin Tesseract), con el
+    nomenclador, los CP y lo aprendido de hoy. Sin la confianza por palabra del OCR original, la
+    confianza es la similitud de la coincidencia. Devuelve lo mismo que clasificar_imagen.
+    """
+    res = {"path": path, "cordon": "cordon_no_identificado", "ciudad": None, "subregion": None,
+           "envio": None, "duplicado": False, "texto": texto, "confianza": 0.0, "decision": "pendiente"}
+    lineas = texto.splitlines()
+    hallada = resolver_lugar(lineas)
+    if hallada is not None:
+        i, ciudad, confianza = hallada
+        res.update(cordon=NOMENCLADOR.cordon_de(ciudad), ciudad=ciudad, confianza=round(confianza, 3),
+                   subregion=lineas[i + 1].strip() if i + 1 < len(lineas) else "")
+    elif aprendizaje is not None:
+        aprendido = aprendizaje.predecir(texto)
+        if aprendido is not None:
+            res["cordon"], res["confianza"], _ = aprendido
+    if res["cordon"] in CORDONES:
+        res["decision"] = decidir_por_confianza(res["confianza"])
+    return res
+
+
+# === Vigilancia de carpeta ===
+class VigilanteCarpeta:
+    """
+    Detecta imágenes/ZIPs nuevos en una carpeta (recursivo) y llama a `on_listo(path)` desde un
+    hilo propio cuando el archivo dejó de crecer (tamaño y mtime estables durante `estabilidad` s),
+    para no tomar descargas a medio escribir.
+
+    Con watchdog los candidatos llegan por eventos del SO; sin él se sondea, pero sólo se relistan
+    los directorios cuyo mtime cambió (índice de mtimes), así una carpeta grande cuesta casi nada.
+    En los dos modos la primera pasada recorre toda la carpeta (lo que llegó con la app cerrada),
+    pero sólo toma archivos modificados desde `desde` (epoch); lo anterior queda como ya visto.
+    """
+
+    EXTENSIONES = EXT_IMAGENES + (".zip",)
+
+    def __init__(self, carpeta: str, on_listo, intervalo: float = 2.0, estabilidad: float = 3.0,
+                 desde: float = 0.0):
+        self.carpeta = carpeta
+        self.on_listo = on_listo
+        self.intervalo = intervalo
+        self.estabilidad = estabilidad
+        self.desde_ns = int(desde * 1e9)
+
+        self._vistos = {}       # path -> (size, mtime_ns) ya entregados
+        self._candidatos = {}   # path -> (size, mtime_ns, desde)
+        self._mtimes_dir = {}   # dir -> mtime_ns (sondeo)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._hilo = None
+        self._observer = None
+
+    # --- ciclo de vida ---
+    def iniciar(self) -> None:
+        if WATCHDOG:
+            vig = self
+
+            class _Handler(FileSystemEventHandler):
+                def on_created(self, event):
+                    if not event.is_directory:
+                        vig._marcar(event.src_path)
+
+                def on_modified(self, event):
+                    if not event.is_directory:
+                        vig._marcar(event.src_path)
+
+                def on_moved(self, event):
+                    if not event.is_directory:
+                        vig._marcar(event.dest_path)
+
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), self.carpeta, recursive=True)
+            self._observer.start()
+
+        self._hilo = threading.Thread(target=self._loop, name="vigilante", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+            self._observer = None
+
+    # --- internos ---
+    def _marcar(self, path: str, inicial: bool = False) -> None:
+        if not path.lower().endswith(self.EXTENSIONES):
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        firma = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if self._vistos.get(path) == firma:
+                return
+            if inicial and st.st_mtime_ns < self.desde_ns:
+                self._vistos[path] = firma  # ya estaba antes de empezar a vigilar
+                return
+            prev = self._candidatos.get(path)
+            if prev is None or prev[:2] != firma:
+                self._candidatos[path] = (firma[0], firma[1], time.monotonic())
+
+    def _escanear(self, inicial: bool = False) -> None:
+        """Sondeo: relista sólo directorios nuevos o cuyo mtime cambió desde la última pasada."""
+        pendientes = [self.carpeta]
+        while pendientes:
+            d = pendientes.pop()
+            try:
+                mt = os.stat(d).st_mtime_ns
+            except OSError:
+                self._mtimes_dir.pop(d, None)
+                continue
+            cambiado = self._mtimes_dir.get(d) != mt
+            self._mtimes_dir[d] = mt
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        if e.is_dir(follow_symlinks=False):
+                            pendientes.append(e.path)
+                        elif cambiado:
+                            self._marcar(e.path, inicial)
+            except OSError:
+                continue
+
+    def _revisar_candidatos(self) -> list:
+        ahora = time.monotonic()
+        listos = []
+        with self._lock:
+            items = list(self._candidatos.items())
+        for path, (size, mtime, desde) in items:
+            try:
+                st = os.stat(path)
+            except OSError:
+                with self._lock:
+                    self._candidatos.pop(path, None)
+                continue
+            firma = (st.st_size, st.st_mtime_ns)
+            with self._lock:
+                if firma != (size, mtime):
+                    # Sigue escribiéndose: reiniciar la ventana de estabilidad
+                    self._candidatos[path] = (firma[0], firma[1], ahora)
+                elif ahora - desde >= self.estabilidad:
+                    self._candidatos.pop(path, None)
+                    self._vistos[path] = firma
+                    listos.append(path)
+        return listos
+
+    def _loop(self) -> None:
+        inicial = True
+        while not self._stop.is_set():
+            try:
+                if inicial or not WATCHDOG:
+                    self._escanear(inicial)  # con watchdog, sólo lo que ya estaba al arrancar
+                    inicial = False
+                for path in self._revisar_candidatos():
+                    if self._stop.is_set():
+                        break
+                    try:
+                        self.on_listo(path)
+                    except Exception as e:
+                        print("Error procesando archivo vigilado:", path, e)
+            except Exception as e:
+                print("Error en vigilancia:", e)
+            self._stop.wait(self.intervalo)
+
+
+# === IDs estables de Remito / Guía Agente ===
+class SecuenciaRemitos:
+    """
+    Asigna a cada grupo del detallado (fecha, cliente, cordón, localidad, domicilio) un número
+    correlativo la primera vez que se agrupa y lo recuerda, así cada re-exportación repite los mismos
+    Remito/Guía Agente. Asignar es O(1) (dict + contador); con el BLOQUEO tomado se relee el archivo
+    si otro proceso asignó números, y se reescribe (atómico) sólo si hubo asignaciones nuevas.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._firma = None
+        self._leer()
+
+    def _leer(self) -> None:
+        raw = load_json(self.path, {})
+        self.siguiente = int(raw.get("siguiente", 1))
+        self.asignados = dict(raw.get("asignados", {}))
+        self._firma = firma_archivo(self.path)
+
+    @staticmethod
+    def clave(partes) -> str:
+        return "|".join(str(p) for p in partes)
+
+    def asignar(self, grupos) -> list:
+        """Número de cada grupo (iterable de tuplas), asignando los que todavía no tenían."""
+        with BLOQUEO:
+            if firma_archivo(self.path) != self._firma:
+                self._leer()
+            nums, nuevos = [], False
+            for g in grupos:
+                k = self.clave(g)
+                n = self.asignados.get(k)
+                if n is None:
+                    n = self.asignados[k] = self.siguiente
+                    self.siguiente += 1
+                    nuevos = True
+                nums.append(n)
+            if nuevos:
+                self.guardar()
+        return nums
+
+    def guardar(self) -> None:
+        save_json(self.path, {"siguiente": self.siguiente, "asignados": self.asignados}, indent=None)
+        self._firma = firma_archivo(self.path)
+
+
+# === Motor de exportación detallada ===
+def construir_filas_detalle(subregs: dict) -> list:
+    """
+    Filas base para agrupar: [ (Fecha ISO, Día, Cliente, Cordón, Localidad, Domicilio), ... ]
+    (tuplas en el orden de COLS_GRUPO_DETALLE). La fecha es la clave del detallado; en semanas
+    archivadas con el esquema viejo (por día de la semana) se toma la fecha del ts de cada fila.
+    """
+    rows = []
+    defecto = TARIFAS.cliente_defecto
+    for clave, items in subregs.items():
+        por_fecha = es_fecha_iso(clave)
+        if por_fecha:
+            f, dia = clave, dia_semana(clave)
+        for s in items:
+            cordon = s.get("Cordon") or NOMENCLADOR.cordon_de(s.get("Ciudad", ""))
+            if cordon not in PRECIOS:
+                cordon = "cordon_no_identificado"
+            if not por_fecha:
+                try:
+                    f = datetime.fromisoformat(s.get("ts", "")).date().isoformat()
+                except ValueError:
+                    f = ""
+                dia = clave
+            rows.append((
+                f,
+                dia,
+                s.get("Cliente") or defecto,
+                cordon,
+                s.get("Ciudad", "") or "—",
+                s.get("Subregión", "") or "—",
+            ))
+    return rows
+
+
+COLS_GRUPO_DETALLE = ["Fecha", "Día", "Cliente", "Cordón", "Localidad", "Domicilio"]
+COLS_DETALLE = ["Fecha", "Día", "Cliente", "Remito", "Guía Agente",
+                "Cordón", "Localidad", "Domicilio", "Cantidad", "Importe"]
+COLS_DETALLE_MD = ["Fecha", "Día", "Cliente", "Cordón", "Localidad", "Domicilio", "Cantidad", "Importe"]
+
+
+def agrupar_detalle(rows: list, secuencia: SecuenciaRemitos = None):
+    """
+    Arma UNA vez el DataFrame agrupado por (Fecha, Día, Cliente, Cordón, Localidad, Domicilio) con
+    Cantidad, Importe e IDs, listo para cualquier formato. Día/Cliente/Cordón/Localidad van como
+    categóricas: ocupan menos y el groupby trabaja sobre códigos enteros.
+    Con `secuencia` los Remito/Guía Agente son estables entre exportaciones; sin ella, correlativos.
+    """
+    df = pd.DataFrame(rows, columns=COLS_GRUPO_DETALLE)
+    df["Día"] = pd.Categorical(df["Día"], categories=DIAS_SEMANA, ordered=True)
+    df["Cordón"] = pd.Categorical(df["Cordón"], categories=list(PRECIOS) + ["cordon_no_identificado"])
+    df["Localidad"] = df["Localidad"].astype("category")
+    df["Cliente"] = df["Cliente"].astype("category")
+
+    agg = (
+        df.groupby(COLS_GRUPO_DETALLE, observed=True, sort=True)
+        .size()
+        .reset_index(name="Cantidad")
+    )
+    # Precio unitario = tarifa [(fecha, cliente) de la fila, código de Cordón] (misma que el resumen)
+    pares = list(zip(agg["Fecha"].tolist(), agg["Cliente"].tolist()))
+    unicos = list(dict.fromkeys(pares))
+    pos = {par: i for i, par in enumerate(unicos)}
+    tabla = np.vstack([TARIFAS.vector(f, cli) for f, cli in unicos]) if unicos else np.zeros((0, 1), dtype=np.int64)
+    filas = np.fromiter((pos[par] for par in pares), dtype=np.int64, count=len(pares))
+    agg["Importe"] = tabla[filas, agg["Cordón"].cat.codes.to_numpy()] * agg["Cantidad"].to_numpy()
+
+    # IDs: estables por grupo (secuencia persistente, con la fecha ISO) o simples correlativos
+    if secuencia is not None:
+        nums = secuencia.asignar(zip(*(agg[c].tolist() for c in COLS_GRUPO_DETALLE if c != "Día")))
+    else:
+        nums = range(1, len(agg) + 1)
+    agg["Remito"] = ["RM" + str(n).zfill(8) for n in nums]
+    agg["Guía Agente"] = ["GA" + str(n).zfill(8) for n in nums]
+
+    # Se agrupa con la fecha ISO (ordena bien entre meses) y recién acá se formatea
+    agg["Fecha"] = pd.to_datetime(agg["Fecha"], format="%Y-%m-%d", errors="coerce").dt.strftime("%d/%m/%Y")
+    return agg[COLS_DETALLE]
+
+
+FORMATO_IMPORTE = '"$" #,##0'
+
+
+def _filas_python(df):
+    """
+    Itera las filas como tuplas de tipos nativos (sin numpy) columna a columna, sin copiar el frame.
+    Los vacíos (NaN/NaT, p. ej. la Fecha de una fila con ts ilegible) salen como "": xlsxwriter
+    rechaza NaN y openpyxl lo dejaría como un número inválido.
+    """
+    columnas = []
+    for c in df.columns:
+        serie = df[c]
+        if serie.isna().any():
+            serie = serie.astype(object).where(serie.notna(), "")
+        columnas.append(serie.tolist())
+    return zip(*columnas)
+
+
+def _escribir_xlsx(df, path: str) -> None:
+    """
+    Escribe el Excel en streaming: cada fila se vuelca a disco al agregarse, sin armar el libro
+    completo en memoria (xlsxwriter constant_memory, o openpyxl write-only como alternativa).
+    """
+    encabezados = list(df.columns)
+    col_importe = encabezados.index("Importe") if "Importe" in encabezados else None
+
+    if XLSXWRITER:
+        wb = xlsxwriter.Workbook(path, {"constant_memory": True})
+        ws = wb.add_worksheet("Detalle")
+        ws.set_column(0, len(encabezados) - 1, 16)
+        if col_importe is not None:
+            ws.set_column(col_importe, col_importe, 14, wb.add_format({"num_format": FORMATO_IMPORTE}))
+        ws.write_row(0, 0, encabezados, wb.add_format({"bold": True}))
+        for i, fila in enumerate(_filas_python(df), 1):
+            ws.write_row(i, 0, fila)
+        wb.close()
+        return
+
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Detalle")
+    cab = []
+    for h in encabezados:
+        c = WriteOnlyCell(ws, value=h)
+        c.font = Font(bold=True)
+        cab.append(c)
+    ws.append(cab)
+    for fila in _filas_python(df):
+        if col_importe is not None:
+            fila = list(fila)
+            c = WriteOnlyCell(ws, value=fila[col_importe])
+            c.number_format = FORMATO_IMPORTE
+            fila[col_importe] = c
+        ws.append(fila)
+    wb.save(path)
+
+
+def _escribir_csv(df, path: str) -> None:
+    # utf-8-sig para que Excel respete los acentos al abrirlo con doble clic
+    df.to_csv(path, index=False, encoding="utf-8-sig")
+
+
+def _escribir_parquet(df, path: str) -> None:
+    df.to_parquet(path, index=False)
+
+
+def _escribir_md(df, path: str) -> None:
+    md_parts = []
+    md_parts.append("# 📦 Exportación detallada de entregas (agrupado)\n")
+    md_parts.append(df[COLS_DETALLE_MD].to_markdown(index=False, tablefmt="github"))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(md_parts))
+
+
+ESCRITORES_DETALLE = {
+    "xlsx": _escribir_xlsx,
+    "csv": _escribir_csv,
+    "parquet": _escribir_parquet,
+    "md": _escribir_md,
+}
+
+
+def exportar_detalle(df, base_path: str, formatos) -> tuple:
+    """
+    Escribe el mismo DataFrame agrupado en varios formatos (mismo nombre, distinta extensión).
+    Devuelve (escritos, errores) para informar qué formato falló (p. ej. falta pyarrow/tabulate).
+    """
+    base = os.path.splitext(base_path)[0]
+    escritos, errores = [], []
+    for fmt in formatos:
+        destino = f"{base}.{fmt}"
+        try:
+            ESCRITORES_DETALLE[fmt](df, destino)
+            escritos.append(destino)
+        except ImportError as e:
+            errores.append(f"{fmt}: falta una dependencia ({str(e).splitlines()[0]})")
+        except Exception as e:
+            errores.append(f"{fmt}: {e}")
+    return escritos, errores
+
+
+CLIENTE_AUTO = "Automático (por etiqueta)"
+CLIENTE_TODOS = "Todos los clientes"
+
+
+# === Snapshot binario del estado ===
+# Cabecera: b"FLXS" + versión de esquema (uint16) + códec (0 = JSON, 1 = msgpack); después el cuerpo
+# comprimido con zlib. Las filas del detallado van en columnas; fecha, cordón, ciudad, cliente y la
+# carpeta del Src se guardan como códigos enteros contra su tabla de valores únicos.
+SNAPSHOT_MAGIA = b"FLXS"
+SNAPSHOT_ESQUEMA = 3  # 2: columnas confianza/revisar; 3: texto OCR de los pendientes (los anteriores se leen sin ellos)
+_SNAPSHOT_CAB = struct.Struct(">4sHB")
+
+
+def _codificar(valores: list) -> tuple:
+    """(valores únicos en orden de aparición, código de cada valor)."""
+    tabla = {}
+    codigos = [tabla.setdefault(v, len(tabla)) for v in valores]
+    return list(tabla), codigos
+
+
+def _partir_ruta(ruta: str) -> tuple:
+    """(carpeta con su separador final, nombre): carpeta + nombre vuelve a dar la ruta exacta."""
+    i = max(ruta.rfind("/"), ruta.rfind("\\")) + 1
+    return ruta[:i], ruta[i:]
+
+
+def guardar_snapshot(path: str, data: dict, subregs: dict, pendientes: list, textos: dict = None) -> None:
+    fechas, filas = [], []
+    for f, items in subregs.items():
+        fechas.extend([f] * len(items))
+        filas.extend(items)
+    src = [_partir_ruta(r.get("Src", "")) for r in filas]
+    cols = {"n": len(filas)}
+    for nombre, valores in (
+        ("fecha", fechas),
+        ("cordon", [r["Cordon"] for r in filas]),
+        ("ciudad", [r.get("Ciudad", "") for r in filas]),
+        ("cliente", [r.get("Cliente", "") for r in filas]),
+        ("src_dir", [d for d, _ in src]),
+    ):
+        cols[nombre + "_tabla"], cols[nombre] = _codificar(valores)
+    cols["src_nombre"] = [n for _, n in src]
+    cols["subregion"] = [r.get("Subregión", "") for r in filas]
+    cols["manual"] = [1 if r.get("Manual") else 0 for r in filas]
+    cols["ts"] = [r.get("ts", "") for r in filas]
+    cols["envio"] = [r.get("Envio", "") for r in filas]
+    cols["confianza"] = [r.get("Confianza") for r in filas]
+    cols["revisar"] = [1 if r.get("Revisar") else 0 for r in filas]
+
+    textos = textos or {}
+    cuerpo = {"data": data, "pendientes": pendientes, "pendientes_texto": [textos.get(p, "") for p in pendientes],
+              "filas": cols, "dias": list(subregs)}
+    if MSGPACK:
+        crudo, codec = msgpack.packb(cuerpo, use_bin_type=True), 1
+    else:
+        crudo, codec = json.dumps(cuerpo, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 0
+    escribir_atomico(path, _SNAPSHOT_CAB.pack(SNAPSHOT_MAGIA, SNAPSHOT_ESQUEMA, codec) + zlib.compress(crudo, 1))
+
+
+def cargar_snapshot(path: str):
+    """(data, subregs, pendientes, textos OCR de los pendientes) del snapshot, o None si no existe."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    magia, esquema, codec = _SNAPSHOT_CAB.unpack_from(raw)
+    if magia != SNAPSHOT_MAGIA or esquema > SNAPSHOT_ESQUEMA:
+        raise ValueError(f"{path}: snapshot desconocido (esquema {esquema})")
+    crudo = zlib.decompress(raw[_SNAPSHOT_CAB.size:])
+    if codec == 1:
+        if not MSGPACK:
+            raise ValueError(f"{path} está guardado con msgpack: pip install msgpack")
+        cuerpo = msgpack.unpackb(crudo, raw=False, strict_map_key=False)
+    else:
+        cuerpo = json.loads(crudo)
+
+    c = cuerpo["filas"]
+    subregs = {d: [] for d in cuerpo["dias"]}
+    fechas, cordones, ciudades = c["fecha_tabla"], c["cordon_tabla"], c["ciudad_tabla"]
+    clientes, dirs = c["cliente_tabla"], c["src_dir_tabla"]
+    for f, co, ci, sub, sd, sn, man, ts, env, cli, conf, rev in zip(
+        c["fecha"], c["cordon"], c["ciudad"], c["subregion"], c["src_dir"], c["src_nombre"],
+        c["manual"], c["ts"], c["envio"], c["cliente"],
+        c.get("confianza") or [None] * c["n"], c.get("revisar") or [0] * c["n"],
+    ):
+        subregs[fechas[f]].append(
+            FilaDetalle(cordones[co], ciudades[ci], sub, dirs[sd] + sn, man, ts, env, clientes[cli], conf, rev)
+        )
+    textos = {p: t for p, t in zip(cuerpo["pendientes"], cuerpo.get("pendientes_texto", ())) if t}
+    return cuerpo["data"], subregs, cuerpo["pendientes"], textos
+
+
+# === Bitácora de avance ===
+class BitacoraAvance:
+    """
+    Registro de sólo-agregado (una línea JSON por cambio) entre dos guardados completos del
+    almacén. Anotar cuesta una línea + fsync; si la app se corta a mitad de un lote, al abrir se
+    reaplican las líneas que todavía no llegaron a los archivos. Las posiciones son en bytes, así
+    otro proceso puede leer sólo lo nuevo. Se vacía en cada guardado.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = None
+
+    def anotar(self, entrada: dict) -> int:
+        """Agrega la entrada y devuelve la posición final del archivo."""
+        if self._f is None:
+            self._f = open(self.path, "ab")
+        self._f.write(json.dumps(entrada, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return self._f.tell()
+
+    def leer(self, desde: int = 0) -> tuple:
+        """(entradas completas a partir de `desde`, posición hasta donde se leyó)."""
+        entradas = []
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(desde)
+                for linea in f:
+                    if not linea.endswith(b"\n"):
+                        break  # última línea a medio escribir
+                    try:
+                        entradas.append(json.loads(linea))
+                    except ValueError:
+                        break
+                    desde += len(linea)
+        except FileNotFoundError:
+            pass
+        return entradas, desde
+
+    def vaciar(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if os.path.exists(self.path):
+            open(self.path, "wb").close()
+
+
+# === Estado persistente compartido ===
+class Almacen:
+    """
+    Conteos, detallado y pendientes con sus índices y los archivos donde se guardan. Lo usan la UI,
+    el vigilante y la API HTTP; quien lee o modifica toma `lock`, que también excluye a otros
+    procesos (BLOQUEO) y al tomarlo incorpora lo que otro proceso guardó o anotó en la bitácora.
+    `rev` cambia en cada persistencia y con cada resultado aplicado (los cachés de la UI se invalidan
+    con ella; la cola guarda completo cada tanto y entre medio sus cambios sólo van a la bitácora).
+    """
+
+    ARCHIVOS = (SNAPSHOT_FILE,)
+
+    def __init__(self):
+        self.lock = Transaccion(BLOQUEO, self._sincronizar)
+        self.remitos = SecuenciaRemitos(REMITOS_FILE)
+        self.aprendizaje = Aprendizaje(APRENDIZAJE_FILE)
+        self.bitacora = BitacoraAvance(AVANCE_FILE)
+        self.rev = 0
+        with BLOQUEO:
+            self._cargar()
+            self._reanudar()
+
+    def _cargar(self) -> None:
+        self.procesados = IndiceProcesados(PROCESADOS_FILE)
+        self.historial = Historial(HIST_DIR)
+        snap = cargar_snapshot(SNAPSHOT_FILE)
+        if snap is not None:
+            # El snapshot ya está en el esquema actual: no hay nada que migrar
+            self.data, self.subregs, self.pendientes, self.textos = snap
+        else:
+            self._importar_json()
+        self.fechas = sorted(set(self.data) | set(self.subregs))  # índice de fechas para rangos
+        self.por_cliente = indexar_clientes(self.subregs)         # índice cliente → fecha → cordón
+        self.envios = self.envios_registrados()                   # N° de envío ya registrados (duplicados)
+        if not self.procesados.existia:
+            self._sembrar_procesados()
+        self._firmas = self._firmas_archivos()
+        self._leido = 0  # bytes de la bitácora ya incorporados
+
+    def _firmas_archivos(self) -> tuple:
+        return tuple(firma_archivo(p) for p in self.ARCHIVOS)
+
+    def _sincronizar(self) -> None:
+        """Al tomar el lock: releer si otro proceso guardó y aplicar lo que anotó desde entonces."""
+        cambio = False
+        if self._firmas_archivos() != self._firmas:
+            self._cargar()
+            cambio = True
+        self.aprendizaje.sincronizar()
+        entradas, self._leido = self.bitacora.leer(self._leido)
+        for e in entradas:
+            self._reaplicar(e)
+        if cambio or entradas:
+            self.rev += 1
+
+    def sincronizar(self) -> None:
+        with self.lock:
+            pass
+
+    # ---------------- Altas ----------------
+    def clasificar_y_aplicar(self, path: str, fecha: str, cliente: str = None) -> str:
+        """
+        Clasifica una imagen (el OCR corre sin tomar el lock) y la registra en `fecha` sin guardar.
+        Devuelve "aplicada", "duplicado" u "omitida" (ya procesada antes).
+        """
+        if self.procesados.ya_procesado(path):
+            return "omitida"
+        res = clasificar_imagen(path, self.envios, self.aprendizaje)
+        with self.lock:
+            if self.procesados.ya_procesado(path):  # otro worker la registró mientras tanto
+                return "omitida"
+            ok = self.aplicar_resultado(fecha, res, cliente)
+            self.procesados.registrar(path)
+        return "aplicada" if ok else "duplicado"
+
+    def aplicar_resultado(self, fecha: str, res: dict, cliente: str = None) -> bool:
+        """
+        Registra el resultado de clasificar_imagen en los datos en memoria (sin guardar): con
+        decisión "pendiente" (o sin cordón) va a pendientes; con "revisar" se cuenta marcada.
+        Devuelve False si la etiqueta era un envío duplicado y se descartó.
+        """
+        cordon, ciudad, sub, envio = res["cordon"], res["ciudad"], res["subregion"], res["envio"]
+        p = res["path"]
+
+        if res["duplicado"] or (envio and envio in self.envios):
+            return False
+
+        if cordon == "cordon_no_identificado" or res.get("decision") == "pendiente":
+            if p not in self.pendientes:
+                self.pendientes.append(p)
+                if res.get("texto"):
+                    self.textos[p] = res["texto"]
+                self._leido = self.bitacora.anotar({"op": "pend", "path": p, "texto": res.get("texto", "")})
+        else:
+            # Contador por fecha/cordón
+            vals = self.data.setdefault(fecha, {})
+            vals[cordon] = vals.get(cordon, 0) + 1
+            # Fila detallada SIEMPRE (aunque subregión esté vacía)
+            fila = self.agregar_detalle(
+                fecha=fecha,
+                cordon=cordon,
+                ciudad=ciudad or "",
+                subregion=sub or "",
+                src_path=p,
+                manual=False,
+                envio=envio or "",
+                cliente=cliente or TARIFAS.cliente_por_texto(res.get("texto", "")) or TARIFAS.cliente_defecto,
+                confianza=res.get("confianza"),
+                revisar=res.get("decision") == "revisar",
+            )
+            self._leido = self.bitacora.anotar({"op": "fila", "fecha": fecha, "fila": fila.a_dict()})
+        self.rev += 1
+        return True
+
+    def confirmar_pendiente(self, ruta: str, fecha: str, cordon: str, subregion: str = "",
+                            cliente: str = None) -> None:
+        """
+        Cuenta un pendiente con el cordón elegido a mano y lo saca de la lista (sin guardar).
+        El texto OCR que no se pudo clasificar se le enseña a `aprendizaje` con el cordón elegido.
+        """
+        if cordon not in CORDONES:
+            raise ValueError(f"Cordón inválido: {cordon}")
+
+        # Guardar detalle con el cordón elegido; ciudad vacía si no la sabemos.
+        try:
+            envio, _ = leer_envio(Image.open(ruta))
+        except Exception:
+            envio = None
+
+        vals = self.data.setdefault(fecha, {})
+        vals[cordon] = vals.get(cordon, 0) + 1
+        fila = self.agregar_detalle(
+            fecha=fecha,
+            cordon=cordon,
+            ciudad="",
+            subregion=subregion,
+            src_path=ruta,
+            manual=True,
+            envio=envio or "",
+            cliente=cliente or TARIFAS.cliente_defecto,
+        )
+        if ruta in self.pendientes:
+            self.pendientes.remove(ruta)
+        texto = self.textos.pop(ruta, "")
+        if texto:
+            self.aprendizaje.aprender(texto, cordon)
+        self._leido = self.bitacora.anotar({"op": "fila", "fecha": fecha, "fila": fila.a_dict()})
+
+    def reclasificar_pendientes(self, fecha: str, cliente: str = None, workers: int = 2) -> dict:
+        """
+        Vuelve a pasar todos los pendientes por el clasificador actual (p. ej. después de sumar
+        localidades o de que se aprendieran alias) y cuenta en `fecha` los que ahora se resuelven.
+        Los que tienen texto OCR guardado se re-emparejan sin Tesseract (microsegundos cada uno);
+        sólo los que no lo tienen se vuelven a leer, en `workers` hilos en paralelo. El trabajo
+        pesado corre sin el lock; al aplicar se saltean los que mientras tanto alguien confirmó.
+        Devuelve {"resueltas", "a_revisar", "duplicadas", "siguen", "releidas", "faltan"} y guarda.
+        Antes relee localidades.json: para eso existe (sumar una ciudad y que rinda en el momento).
+        """
+        recargar_nomenclador()
+        with self.lock:
+            pendientes = list(self.pendientes)
+            textos = dict(self.textos)
+            envios = set(self.envios)
+
+        sin_texto = [p for p in pendientes if not textos.get(p) and os.path.exists(p)]
+        resultados = [clasificar_texto(p, textos[p], self.aprendizaje) for p in pendientes if textos.get(p)]
+        if sin_texto:
+            def leer(p):
+                try:
+                    return clasificar_imagen(p, envios, self.aprendizaje)
+                except Exception as e:
+                    print("Error reclasificando:", p, e)
+                    return None
+            with futuros.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                resultados.extend(r for r in pool.map(leer, sin_texto) if r is not None)
+
+        cuenta = {"resueltas": 0, "a_revisar": 0, "duplicadas": 0, "siguen": 0, "releidas": len(sin_texto),
+                  "faltan": sum(1 for p in pendientes if not textos.get(p) and not os.path.exists(p))}
+        with self.lock:
+            for res in resultados:
+                p = res["path"]
+                if p not in self.pendientes:
+                    continue  # confirmado a mano mientras tanto
+                if res["decision"] == "pendiente" and not res["duplicado"]:
+                    if res.get("texto") and not self.textos.get(p):
+                        self.textos[p] = res["texto"]  # la próxima vez ya no hace falta OCR
+                    cuenta["siguen"] += 1
+                    continue
+                self.pendientes.remove(p)
+                self.textos.pop(p, None)
+                if not self.aplicar_resultado(fecha, res, cliente):
+                    cuenta["duplicadas"] += 1
+                else:
+                    cuenta["a_revisar" if res["decision"] == "revisar" else "resueltas"] += 1
+            self.persistir()
+        return cuenta
+
+    def agregar_detalle(self, fecha: str, cordon: str, ciudad: str, subregion: str,
+                        src_path: str = "", manual: bool = False, envio: str = "",
+                        cliente: str = "", ts: str = None, confianza: float = None,
+                        revisar: bool = False) -> FilaDetalle:
+        row = FilaDetalle(
+            cordon, ciudad, subregion, src_path, manual,
+            ts or datetime.now().isoformat(timespec="seconds"),
+            envio, cliente or TARIFAS.cliente_defecto, confianza, revisar,
+        )
+        self.subregs.setdefault(fecha, []).append(row)
+        self._registrar_fecha(fecha)
+        self.por_cliente[row.Cliente][fecha][row.Cordon] += 1
+        if row.Envio:
+            self.envios.add(row.Envio)
+        return row
+
+    def revisar_fila(self, fecha: str, src: str, ts: str, cordon: str) -> bool:
+        """
+        Resuelve una fila aceptada con duda: queda confirmada con `cordon` (si cambia, se mueve el
+        conteo y pasa a manual). Devuelve False si la fila ya no está marcada (sin guardar).
+        """
+        if cordon not in CORDONES:
+            raise ValueError(f"Cordón inválido: {cordon}")
+        if not self._aplicar_revision(fecha, src, ts, cordon):
+            return False
+        self._leido = self.bitacora.anotar({"op": "revisar", "fecha": fecha, "Src": src, "ts": ts, "cordon": cordon})
+        return True
+
+    def _aplicar_revision(self, fecha: str, src: str, ts: str, cordon: str) -> bool:
+        fila = next((r for r in self.subregs.get(fecha, []) if r.Src == src and r.ts == ts and r.Revisar), None)
+        if fila is None:
+            return False
+        if cordon != fila.Cordon:
+            vals = self.data.setdefault(fecha, {})
+            vals[fila.Cordon] = vals.get(fila.Cordon, 0) - 1
+            vals[cordon] = vals.get(cordon, 0) + 1
+            por_fecha = self.por_cliente[fila.Cliente][fecha]
+            por_fecha[fila.Cordon] -= 1
+            por_fecha[cordon] += 1
+            fila.Cordon = sys.intern(cordon)
+            fila.Manual = True
+        fila.Revisar = False
+        return True
+
+    # ---------------- Consultas ----------------
+    def filas_a_revisar(self) -> list:
+        """[(fecha, fila)] aceptadas con confianza intermedia que nadie confirmó todavía."""
+        return [(f, r) for f in self.fechas for r in self.subregs.get(f, ()) if r.Revisar]
+
+    def envios_registrados(self) -> set:
+        """N° de envío (QR) de todas las filas detalladas, para detectar etiquetas repetidas."""
+        return {s.get("Envio") for items in self.subregs.values() for s in items if s.get("Envio")}
+
+    def filas_en_rango(self, desde: str, hasta: str) -> dict:
+        """Detallado {fecha: filas} entre dos fechas ISO (inclusive), vía el índice de fechas."""
+        return {f: self.subregs[f] for f in fechas_en_rango(self.fechas, desde, hasta) if f in self.subregs}
+
+    def resumen(self, fechas: list, cliente: str = CLIENTE_TODOS) -> dict:
+        """Totales (ver resumir) de `fechas` para un cliente o para todos."""
+        por_cliente = conteos_por_cliente(self.data, self.por_cliente)
+        if cliente in por_cliente:
+            return resumir(por_cliente[cliente], fechas, {cliente: por_cliente[cliente]})
+        if cliente == CLIENTE_TODOS:
+            return resumir(self.data, fechas, por_cliente)
+        return resumir({}, fechas)
+
+    def filas_detalle(self) -> list:
+        return construir_filas_detalle(self.subregs)
+
+    # ---------------- Bajas ----------------
+    def semanas_abiertas(self) -> dict:
+        """{semana ISO: [fechas]} de los datos actuales."""
+        por_semana = defaultdict(list)
+        for f in self.fechas:
+            por_semana[semana_iso(date.fromisoformat(f))].append(f)
+        return dict(por_semana)
+
+    def cerrar_semanas(self) -> None:
+        """Archiva cada fecha en la partición de su semana ISO y empieza de cero (guarda)."""
+        for sem, fechas in self.semanas_abiertas().items():
+            data = {f: self.data[f] for f in fechas if self.data.get(f)}
+            subregs = self.filas_en_rango(fechas[0], fechas[-1])
+            if data or any(subregs.values()):
+                self.historial.archivar(sem, data, subregs)
+
+        self.data = {}
+        self.subregs = {}
+        self.fechas = []
+        self.por_cliente = indexar_clientes(self.subregs)
+        self.envios = set()
+        # Los pendientes se descartan: que vuelvan a entrar si se cargan de nuevo
+        self.procesados.olvidar(self.pendientes)
+        self.pendientes.clear()
+        self.textos.clear()
+        self.persistir()
+
+    def resetear_fecha(self, fecha: str) -> None:
+        """Pone en cero el conteo y el detallado de una fecha (guarda)."""
+        # Las fotos de ese día se pueden volver a cargar para reprocesarlo
+        self.procesados.olvidar(s.get("Src") for s in self.subregs.get(fecha, []))
+
+        self.data.pop(fecha, None)
+        self.subregs.pop(fecha, None)
+        for por_fecha in self.por_cliente.values():
+            por_fecha.pop(fecha, None)
+        self.envios = self.envios_registrados()
+
+        self.persistir()
+
+    # ---------------- Persistencia ----------------
+    def persistir(self) -> None:
+        """Guarda el snapshot del estado y el índice de procesados, y marca los datos como modificados."""
+        guardar_snapshot(SNAPSHOT_FILE, self.data, self.subregs, self.pendientes, self.textos)
+        self.procesados.guardar()
+        self.aprendizaje.guardar()
+        self.bitacora.vaciar()  # todo lo anotado ya está en los archivos
+        self._firmas, self._leido = self._firmas_archivos(), 0
+        self.rev += 1
+
+    def guardar(self) -> None:
+        """persistir() tomando el lock."""
+        with self.lock:
+            self.persistir()
+
+    def _registrar_fecha(self, fecha: str) -> None:
+        i = bisect.bisect_left(self.fechas, fecha)
+        if i == len(self.fechas) or self.fechas[i] != fecha:
+            self.fechas.insert(i, fecha)
+
+    def _reanudar(self) -> None:
+        """
+        Al abrir: incorpora lo anotado en la bitácora después del último guardado (corte a mitad de
+        un lote, u otro proceso que todavía no guardó) y deja todo en los archivos.
+        """
+        entradas, _ = self.bitacora.leer()
+        if not entradas:
+            return
+        reaplicadas = sum(self._reaplicar(e) for e in entradas)
+        print(f"Bitácora: {reaplicadas} de {len(entradas)} cambios sin guardar reaplicados.")
+        self.persistir()
+
+    def _reaplicar(self, e: dict) -> bool:
+        """Aplica una entrada de la bitácora; una fila que ya figura (misma fecha, Src y ts) se omite."""
+        if e.get("op") == "pend":
+            if e["path"] not in self.pendientes:
+                self.pendientes.append(e["path"])
+                if e.get("texto"):
+                    self.textos[e["path"]] = e["texto"]
+            self.procesados.registrar(e["path"])
+            return False
+        if e.get("op") == "revisar":
+            return self._aplicar_revision(e["fecha"], e["Src"], e["ts"], e["cordon"])
+        fecha, fila = e["fecha"], e["fila"]
+        nueva = not any(r.get("Src") == fila["Src"] and r.get("ts") == fila["ts"]
+                        for r in self.subregs.get(fecha, []))
+        if nueva:
+            vals = self.data.setdefault(fecha, {})
+            vals[fila["Cordon"]] = vals.get(fila["Cordon"], 0) + 1
+            self.agregar_detalle(
+                fecha, fila["Cordon"], fila["Ciudad"], fila["Subregión"], fila["Src"],
+                fila["Manual"], fila["Envio"], fila["Cliente"], fila["ts"],
+                fila.get("Confianza"), fila.get("Revisar", False),
+            )
+        if fila["Src"] in self.pendientes:
+            self.pendientes.remove(fila["Src"])
+            self.textos.pop(fila["Src"], None)
+        if fila["Src"]:
+            self.procesados.registrar(fila["Src"])
+        return nueva
+
+    def _sembrar_procesados(self) -> None:
+        """Primera vez con índice: registra las fuentes que ya figuran en el detallado y en pendientes."""
+        srcs = {s.get("Src") for items in self.subregs.values() for s in items if s.get("Src")}
+        srcs.update(self.pendientes)
+        for src in srcs:
+            if os.path.exists(src):
+                self.procesados.registrar(src)
+        self.procesados.guardar()
+
+    def _importar_json(self) -> None:
+        """
+        Primer arranque con snapshot: lee los JSON del esquema anterior, los migra, escribe el
+        snapshot y deja los JSON renombrados como *.importado (así la migración corre una sola vez).
+        """
+        self.data = load_json(DATA_FILE, {})
+        self.subregs = load_json(SUBREG_FILE, {})
+        self.pendientes = load_json(PEND_FILE, [])
+        self.textos = {}
+        self._migrar_esquema()
+        guardar_snapshot(SNAPSHOT_FILE, self.data, self.subregs, self.pendientes)
+        for viejo in (DATA_FILE, SUBREG_FILE, PEND_FILE):
+            if os.path.exists(viejo):
+                os.replace(viejo, viejo + ".importado")
+
+    def _migrar_esquema(self) -> None:
+        """
+        Pasa el esquema por día de la semana al esquema por fecha real (usando el ts de cada fila),
+        garantiza que cada entrada tenga: Cordon, Ciudad, Subregión, Src, Manual, ts, Envio, Cliente
+        y completa Cordon si falta (buscando por Ciudad).
+        """
+        self.data, self.subregs, _ = migrar_a_fechas(self.data, self.subregs, date.today())
+        for dia, items in self.subregs.items():
+            new_items = []
+            for s in items:
+                cordon = s.get("Cordon")
+                ciudad = s.get("Ciudad", "") or ""
+                subreg = s.get("Subregión", "") or ""
+                src = s.get("Src", "")
+                manual = bool(s.get("Manual", False))
+                ts = s.get("ts")
+
+                if not cordon:
+                    cordon = NOMENCLADOR.cordon_de(ciudad) if ciudad else "cordon_no_identificado"
+                    if cordon not in PRECIOS:
+                        cordon = "cordon_no_identificado"
+
+                if not ts:
+                    ts = datetime.now().isoformat(timespec="seconds")
+
+                new_items.append(FilaDetalle(
+                    cordon, ciudad, subreg, src, manual, ts,
+                    s.get("Envio", "") or "", s.get("Cliente") or TARIFAS.cliente_defecto,
+                ))
+            self.subregs[dia] = new_items
+
+
+# === Cola persistente de trabajos ===
+class ColaTrabajos:
+    """
+    Lotes (imágenes y/o ZIPs) a clasificar, guardados en trabajos.json para retomarlos tras un cierre.
+    Un pool fijo de workers toma de a UNA imagen: primero los lotes de hoy y, entre iguales, el que
+    lleva menos imágenes hechas, así un ZIP grande no demora a los lotes chicos que llegan después.
+    Los ZIP se expanden dentro del worker. Si con el lote quedarían más de `max_imagenes` esperando
+    (un ZIP cuenta por las imágenes que trae), agregar() rechaza.
+    Entre guardados completos cada imagen queda en la bitácora del almacén; el guardado completo
+    (almacén + cola) va al terminar un lote o cada GUARDAR_CADA_S, fuera de `_cond`.
+    """
+
+    GUARDAR_CADA_S = 30.0  # cada cuánto se vuelcan almacén + cola mientras hay trabajo
+    REINTENTAR_S = 5.0     # espera antes de reintentar un guardado que falló (sin trabajo en curso)
+    TERMINADOS_MAX = 200   # lotes terminados que se conservan para consultar su estado
+
+    def __init__(self, almacen: Almacen, path: str, carpeta: str, workers: int = 2, max_imagenes: int = 5000):
+        self.almacen = almacen
+        self.path = path
+        self.carpeta = carpeta
+        self.n_workers = max(1, int(workers))
+        self.max_imagenes = int(max_imagenes)
+        self._cond = threading.Condition()
+        self._hilos = []
+        self._activa = False
+        self._volcado = threading.RLock()  # ordena las escrituras de la cola: la última copia es la que queda
+        self._ultimo_guardado = time.monotonic()
+        self._sucio = False
+
+        self.trabajos = load_json(path, {})  # id → {estado, fecha, cliente, origen, creado, total, restantes, en_curso, ...}
+        for t in self.trabajos.values():
+            # Lo que estaba en curso al cerrarse vuelve a la cola (lo ya registrado se omite al retomarlo)
+            if t["estado"] in ("en_cola", "procesando"):
+                t["restantes"] = t["en_curso"] + t["restantes"]
+                t["en_curso"] = []
+                t["estado"] = "en_cola"
+
+    # ---------------- Ciclo de vida ----------------
+    def iniciar(self) -> None:
+        self._activa = True
+        for i in range(self.n_workers):
+            h = threading.Thread(target=self._loop, daemon=True, name=f"cola-{i}")
+            h.start()
+            self._hilos.append(h)
+
+    def detener(self) -> None:
+        with self._cond:
+            self._activa = False
+            self._cond.notify_all()
+        for h in self._hilos:
+            h.join(timeout=5)
+        self._hilos = []
+        self._volcar()
+
+    # ---------------- Alta y consulta ----------------
+    def agregar(self, archivos, fecha: str, cliente: str = None, origen: str = "ui"):
+        """Encola un lote; devuelve su id o None si la cola está llena (reintentar más tarde)."""
+        archivos = list(archivos)
+        zips = {a: imagenes_en_zip(a) for a in archivos if a.lower().endswith(".zip")}
+        n_imagenes = sum(max(1, zips.get(a, 1)) for a in archivos)
+        with self._cond:
+            if self.en_espera() + n_imagenes > self.max_imagenes:
+                return None
+            tid = f"{datetime.now():%Y%m%d%H%M%S}_{os.urandom(3).hex()}"
+            self.trabajos[tid] = {
+                "estado": "en_cola", "fecha": fecha, "cliente": cliente, "origen": origen,
+                "creado": datetime.now().isoformat(timespec="seconds"),
+                "total": len(archivos), "hechas": 0, "restantes": archivos, "en_curso": [],
+                "aplicadas": 0, "omitidas": 0, "duplicados": [], "errores": [], "avisado": False,
+                "imagenes_zip": zips,
+            }
+            self._cond.notify_all()
+        self._guardar()
+        return tid
+
+    def en_espera(self) -> int:
+        """Imágenes esperando; un ZIP todavía sin expandir cuenta por las que trae."""
+        with self._cond:
+            return sum(max(1, t.get("imagenes_zip", {}).get(a, 1))
+                       for t in self.trabajos.values() for a in t["restantes"])
+
+    def estado(self, tid: str):
+        with self._cond:
+            t = self.trabajos.get(tid)
+            if t is None:
+                return None
+            res = {k: v for k, v in t.items() if k not in ("restantes", "en_curso", "imagenes_zip")}
+            res["pendientes"] = len(t["restantes"]) + len(t["en_curso"])
+            return res
+
+    def progreso(self) -> tuple:
+        """(hechas, total) de los lotes sin terminar."""
+        with self._cond:
+            activos = [t for t in self.trabajos.values() if t["estado"] != "terminado"]
+            return sum(t["hechas"] for t in activos), sum(t["total"] for t in activos)
+
+    def tomar_terminados(self, origen: str) -> list:
+        """Lotes de `origen` terminados y todavía no avisados (se marcan como avisados)."""
+        with self._cond:
+            listos = [t for t in self.trabajos.values()
+                      if t["origen"] == origen and t["estado"] == "terminado" and not t["avisado"]]
+            for t in listos:
+                t["avisado"] = True
+        if listos:
+            self._guardar()
+        return listos
+
+    # ---------------- Workers ----------------
+    def _siguiente(self):
+        """(id, archivo) a procesar: prioridad hoy, luego el lote con menos imágenes hechas."""
+        hoy = date.today().isoformat()
+        candidatos = [(t["fecha"] != hoy, t["hechas"] + len(t["en_curso"]), t["creado"], tid)
+                      for tid, t in self.trabajos.items() if t["restantes"]]
+        if not candidatos:
+            return None
+        tid = min(candidatos)[3]
+        t = self.trabajos[tid]
+        archivo = t["restantes"].pop(0)
+        t["en_curso"].append(archivo)
+        t["estado"] = "procesando"
+        return tid, archivo
+
+    def _loop(self) -> None:
+        while True:
+            volcar = False
+            with self._cond:
+                sig = self._siguiente() if self._activa else None
+                while sig is None and self._activa:
+                    if self._sucio and time.monotonic() - self._ultimo_guardado >= self.REINTENTAR_S:
+                        volcar = True
+                        break
+                    self._cond.wait(timeout=self.REINTENTAR_S if self._sucio else self.GUARDAR_CADA_S)
+                    sig = self._siguiente()
+            if volcar:
+                self._volcar()
+                continue
+            if sig is None:
+                return
+            tid, archivo = sig
+            t = self.trabajos[tid]
+
+            if archivo.lower().endswith(".zip"):
+                try:
+                    imgs = extraer_zip(archivo, os.path.join(self.carpeta, tid, os.path.splitext(os.path.basename(archivo))[0]))
+                except Exception as e:
+                    print("Error extrayendo:", archivo, e)
+                    imgs, resultado = [], "error"
+                else:
+                    resultado = None
+                with self._cond:
+                    t["restantes"][:0] = imgs
+                    if imgs:
+                        t["total"] += len(imgs) - 1  # el ZIP pasa a contar por sus imágenes
+                    volcar = self._terminar_archivo(tid, archivo, resultado)
+                if volcar:
+                    self._volcar()
+                continue
+
+            try:
+                resultado = self.almacen.clasificar_y_aplicar(archivo, t["fecha"], t["cliente"])
+            except Exception as e:
+                print("Error procesando:", archivo, e)
+                resultado = "error"
+            with self._cond:
+                volcar = self._terminar_archivo(tid, archivo, resultado)
+            if volcar:
+                self._volcar()
+
+    def _terminar_archivo(self, tid: str, archivo: str, resultado) -> bool:
+        """Anota el resultado (con `_cond` tomado); True si toca un guardado completo."""
+        t = self.trabajos[tid]
+        t["en_curso"].remove(archivo)
+        if resultado is not None:
+            t["hechas"] += 1
+        if resultado == "aplicada":
+            t["aplicadas"] += 1
+        elif resultado == "omitida":
+            t["omitidas"] += 1
+        elif resultado == "duplicado":
+            t["duplicados"].append(os.path.basename(archivo))
+        elif resultado == "error":
+            t["errores"].append(os.path.basename(archivo))
+
+        self._sucio = True
+        if not t["restantes"] and not t["en_curso"]:
+            t["estado"] = "terminado"
+            return True
+        return time.monotonic() - self._ultimo_guardado >= self.GUARDAR_CADA_S
+
+    def _volcar(self) -> None:
+        """
+        Guarda primero el almacén y después la cola: si se corta entre medio, lo ya registrado se omite.
+        Corre sin `_cond` (los workers y progreso() siguen); de la cola sólo se copia el estado con él.
+        """
+        with self._volcado:
+            with self._cond:
+                self._sucio = False
+                self._ultimo_guardado = time.monotonic()
+            try:
+                self.almacen.guardar()
+                self._guardar()
+            except Exception as e:
+                # Lo aplicado sigue en la bitácora: se avisa y se reintenta en la próxima pasada
+                print("Error guardando la cola:", e)
+                with self._cond:
+                    self._sucio = True
+
+    def _podar(self) -> None:
+        terminados = sorted((t["creado"], tid) for tid, t in self.trabajos.items() if t["estado"] == "terminado")
+        for _, tid in terminados[:-self.TERMINADOS_MAX]:
+            del self.trabajos[tid]
+
+    def _guardar(self) -> None:
+        """
+        Escribe la cola fuera de `_cond` con una copia tomada con él. Con `_volcado` las escrituras
+        van de a una y en orden, así una copia vieja nunca pisa a una más nueva.
+        """
+        with self._volcado:
+            with self._cond:
+                self._podar()
+                copia = {tid: {k: list(v) if isinstance(v, list) else v for k, v in t.items()}
+                         for tid, t in self.trabajos.items()}
+            save_json(self.path, copia, indent=None)
+
+
+# === API HTTP local ===
+class ServidorAPI:
+    """
+    API HTTP mínima (asyncio, sólo biblioteca estándar) sobre el mismo Almacen que la UI:
+      POST /clasificar[?fecha=&cliente=]  cuerpo = imagen o ZIP          → 202 {"trabajo": id}
+      GET  /trabajos/<id>                 estado y avance de un lote
+      GET  /totales/dia[?fecha=]          totales de una fecha (hoy por defecto)
+      GET  /totales/semana[?fecha=]       totales lunes–sábado de la semana de esa fecha
+      GET  /pendientes                    imágenes sin cordón identificado + filas aceptadas con duda
+      POST /confirmar                     JSON {path, cordon[, subregion, fecha, cliente]}
+      POST /revisar                       JSON {fecha, path, ts, cordon} resuelve una fila con duda
+    Los lotes van a la ColaTrabajos compartida (llena → 503 + Retry-After), cuyos workers hacen el
+    OCR en sus hilos sin frenar el loop que atiende las conexiones. El loop sólo lee y escribe los
+    sockets: cada pedido se resuelve en un hilo del pool (`HILOS`), porque toma el BLOQUEO entre
+    procesos, puede releer el almacén y escribe subidas de hasta api_max_mb.
+    """
+
+    HILOS = 4
+
+    def __init__(self, almacen: Almacen, cola: ColaTrabajos, cfg: dict, carpeta: str):
+        self.almacen = almacen
+        self.cola = cola
+        self.host = cfg.get("api_host", "127.0.0.1")
+        self.puerto = int(cfg.get("api_puerto", 8765))
+        self.max_bytes = int(float(cfg.get("api_max_mb", 50)) * 1024 * 1024)
+        self.carpeta = carpeta
+        self._loop = None
+        self._detener = None
+        self._hilo = None
+        self._pool = None
+
+    # ---------------- Ciclo de vida ----------------
+    def servir(self) -> None:
+        """Bloquea atendiendo pedidos (modo sin ventana)."""
+        asyncio.run(self._main())
+
+    def iniciar_en_hilo(self) -> None:
+        self._hilo = threading.Thread(target=self.servir, daemon=True, name="api-http")
+        self._hilo.start()
+
+    def detener(self) -> None:
+        if self._loop is not None and self._detener is not None:
+            self._loop.call_soon_threadsafe(self._detener.set)
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._detener = asyncio.Event()
+        self._pool = futuros.ThreadPoolExecutor(max_workers=self.HILOS, thread_name_prefix="api")
+        server = await asyncio.start_server(self._atender, self.host, self.puerto)
+        print(f"API escuchando en http://{self.host}:{self.puerto}")
+        try:
+            async with server:
+                await self._detener.wait()
+        finally:
+            self._pool.shutdown(wait=False)
+
+    # ---------------- Trabajos ----------------
+    def _encolar(self, cuerpo: bytes, tipo: str, query: dict):
+        fecha = query.get("fecha") or date.today().isoformat()
+        if not es_fecha_iso(fecha):
+            return 400, {"error": "fecha debe ser AAAA-MM-DD"}
+        cliente = query.get("cliente") or None
+        if cliente is not None and cliente not in TARIFAS.clientes:
+            return 400, {"error": f"cliente desconocido: {cliente}"}
+        if not cuerpo:
+            return 400, {"error": "cuerpo vacío"}
+
+        if cuerpo[:4] == b"PK\x03\x04" or "zip" in tipo:
+            ext = ".zip"
+        elif cuerpo[:8] == b"\x89PNG\r\n\x1a\n":
+            ext = ".png"
+        else:
+            ext = ".jpg"
+        if self.cola.en_espera() >= self.cola.max_imagenes:
+            return 503, {"error": "cola llena, reintentar más tarde"}
+        os.makedirs(self.carpeta, exist_ok=True)
+        archivo = os.path.join(self.carpeta, f"{datetime.now():%Y%m%d%H%M%S}_{os.urandom(3).hex()}{ext}")
+        with open(archivo, "wb") as f:
+            f.write(cuerpo)
+        tid = self.cola.agregar([archivo], fecha, cliente, origen="api")
+        if tid is None:
+            os.remove(archivo)
+            return 503, {"error": "cola llena, reintentar más tarde"}
+        return 202, {"trabajo": tid}
+
+    # ---------------- HTTP ----------------
+    async def _atender(self, reader, writer) -> None:
+        try:
+            cabecera = await reader.readuntil(b"\r\n\r\n")
+            linea, *resto = cabecera.decode("latin-1").split("\r\n")
+            metodo, destino, _ = linea.split(" ", 2)
+            headers = {}
+            for h in resto:
+                if ":" in h:
+                    k, v = h.split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+            largo = int(headers.get("content-length", 0) or 0)
+            if largo > self.max_bytes:
+                status, cuerpo = 413, {"error": "archivo demasiado grande"}
+            else:
+                datos = await reader.readexactly(largo) if largo else b""
+                url = urlsplit(destino)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                status, cuerpo = await self._loop.run_in_executor(
+                    self._pool, self._rutear, metodo.upper(), url.path.rstrip("/") or "/", query,
+                    datos, headers.get("content-type", ""))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, cuerpo = 400, {"error": "pedido mal formado"}
+        except Exception as e:
+            status, cuerpo = 500, {"error": str(e)}
+
+        payload = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        extra = "Retry-After: 5\r\n" if status == 503 else ""
+        writer.write(
+            f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n{extra}Connection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def _rutear(self, metodo: str, ruta: str, query: dict, cuerpo: bytes, tipo: str):
+        if metodo == "POST" and ruta == "/clasificar":
+            return self._encolar(cuerpo, tipo, query)
+
+        if metodo == "GET" and ruta.startswith("/trabajos/"):
+            trabajo = self.cola.estado(ruta.rsplit("/", 1)[1])
+            if trabajo is None:
+                return 404, {"error": "trabajo inexistente"}
+            return 200, trabajo
+
+        if metodo == "GET" and ruta in ("/totales/dia", "/totales/semana"):
+            fecha = query.get("fecha") or date.today().isoformat()
+            if not es_fecha_iso(fecha):
+                return 400, {"error": "fecha debe ser AAAA-MM-DD"}
+            fechas = [fecha] if ruta.endswith("dia") else fechas_semana(date.fromisoformat(fecha))
+            with self.almacen.lock:
+                res = self.almacen.resumen(fechas, query.get("cliente") or CLIENTE_TODOS)
+            return 200, {
+                "fechas": res["fechas"],
+                "por_fecha": [
+                    {"fecha": f, "por_cordon": dict(zip(res["cordones"], res["conteos"][i].tolist())),
+                     "paquetes": int(res["paquetes"][i]), "importe": int(res["importes"][i])}
+                    for i, f in enumerate(res["fechas"])
+                ],
+                "paquetes": int(res["total_paquetes"]),
+                "importe": int(res["total_importe"]),
+            }
+
+        if metodo == "GET" and ruta == "/pendientes":
+            with self.almacen.lock:
+                return 200, {
+                    "pendientes": list(self.almacen.pendientes),
+                    "a_revisar": [
+                        {"fecha": f, "path": r.Src, "ts": r.ts, "cordon": r.Cordon, "ciudad": r.Ciudad,
+                         "confianza": r.Confianza}
+                        for f, r in self.almacen.filas_a_revisar()
+                    ],
+                }
+
+        if metodo == "POST" and ruta == "/confirmar":
+            try:
+                pedido = json.loads(cuerpo or b"{}")
+            except ValueError:
+                return 400, {"error": "JSON inválido"}
+            ruta_img, cordon = pedido.get("path", ""), pedido.get("cordon", "")
+            fecha = pedido.get("fecha") or date.today().isoformat()
+            if not es_fecha_iso(fecha) or cordon not in CORDONES:
+                return 400, {"error": "cordón o fecha inválidos"}
+            with self.almacen.lock:
+                if ruta_img not in self.almacen.pendientes:
+                    return 404, {"error": "no está en pendientes"}
+                self.almacen.confirmar_pendiente(ruta_img, fecha, cordon, pedido.get("subregion", ""),
+                                                 pedido.get("cliente"))
+                self.almacen.persistir()
+            return 200, {"ok": True}
+
+        if metodo == "POST" and ruta == "/revisar":
+            try:
+                pedido = json.loads(cuerpo or b"{}")
+            except ValueError:
+                return 400, {"error": "JSON inválido"}
+            if pedido.get("cordon") not in CORDONES:
+                return 400, {"error": "cordón inválido"}
+            with self.almacen.lock:
+                if not self.almacen.revisar_fila(pedido.get("fecha", ""), pedido.get("path", ""),
+                                                 pedido.get("ts", ""), pedido["cordon"]):
+                    return 404, {"error": "no está marcada para revisar"}
+                self.almacen.persistir()
+            return 200, {"ok": True}
+
+        return 404, {"error": "ruta inexistente"}
 
 
 # === App principal ===
 class ClasificadorApp(tk.Tk):
     def __init__(self):
         super().__init__()
-        if BOOTSTRAP:
+        # UI moderna opcional (se importa sólo si hay ventana)
+        try:
+            import ttkbootstrap as ttkb
             self.style = ttkb.Style(theme="darkly")
+        except Exception:
+            pass
 
         self.title("FLEX TESSERACT 5.4 — Persistencia Visual y Detallado Agrupado")
         self.geometry("1360x800")
         self.minsize(1100, 720)
 
         # Carpeta fija para ZIPs procesados
-        self.tmpdir = os.path.join(os.getcwd(), "procesos_tmp")
+        self.tmpdir = en_base("procesos_tmp")
         os.makedirs(self.tmpdir, exist_ok=True)
 
-        # Estado persistente base
-        self.dias = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
-        self.dia = tk.StringVar(value="Lunes")
-        self.data = load_json(DATA_FILE, {d: {} for d in self.dias})
-        self.subregs = load_json(SUBREG_FILE, {d: [] for d in self.dias})
-        self.pendientes = load_json(PEND_FILE, [])
+        # Estado persistente base (claves = fecha ISO real; el día de la semana se deriva)
+        self.dia = tk.StringVar(value=etiqueta_fecha(date.today().isoformat()))
+        self.almacen = Almacen()
+        marcar_arranque("datos")
         self._img_refs_pend = []
+        self.cfg = cargar_config()
+        MOTOR_OCR.configurar(self.cfg)
+        MOTOR_OCR.detectar_en_hilo()
+        configurar_confianza(self.cfg)
+
+        # Cachés por revisión de los datos (almacen.rev cambia en cada persistencia)
+        self._rev_visto = self.almacen.rev
+        self._pend_visto = None  # (rutas, filas a revisar) que muestra el panel de pendientes
+        self._detalle_cache = (None, None)
+        self._resumen_cache = (None, None)
+
+        # Clientes: el del lote (o automático por etiqueta) y el que se ve en la tabla resumen
+        self.cliente_lote = tk.StringVar(value=CLIENTE_AUTO)
+        self.cliente_vista = tk.StringVar(value=CLIENTE_TODOS)
+
+        # Vigilancia de carpeta: el hilo del vigilante deja acá los archivos listos (y no procesados);
+        # el hilo de Tk los pasa a la cola de lotes, que los clasifica, guarda y retoma como al resto.
+        self._vigilante = None
+        self._after_vigilancia = None
+        self._vigilados = queue.Queue()
+        self._vigilados_en_espera = []  # listos que la cola rechazó por llena: se reintentan
+        self._reclasificacion = None  # queue.Queue con el resultado mientras corre en segundo plano
+        self._api = None
+
+        # Cola persistente de lotes: retoma al abrir lo que quedó a medias
+        self.cola = ColaTrabajos(
+            self.almacen, TRABAJOS_FILE, os.path.join(self.tmpdir, "cola"),
+            workers=self.cfg.get("cola_workers", 2),
+            max_imagenes=self.cfg.get("cola_max_imagenes", 5000),
+        )
 
         # Selector para "Resetear día"
         self.reset_dia_var = tk.StringVar(value=self.dia.get())  # default = día actual
@@ -143,14 +3027,40 @@ class ClasificadorApp(tk.Tk):
             # Compatibilidad Python <3.8
             self.dia.trace("w", lambda *_: self.reset_dia_var.set(self.dia.get()))
 
-        # Migración de esquema (compatibilidad hacia 5.4)
-        self._migrate_subregs_schema()
-
-        # Construcción UI + renders iniciales
+        # Construcción UI + renders iniciales (las miniaturas de pendientes, con la ventana ya visible)
         self._build_ui()
         self._render_tabla()
-        self._render_pendientes()
         self._update_pend_count()
+        marcar_arranque("ventana")
+        self.after_idle(self._arranque_listo)
+
+        self.protocol("WM_DELETE_WINDOW", self._al_cerrar)
+        if self.cfg.get("vigilancia_activa") and os.path.isdir(self.cfg.get("carpeta_vigilada", "")):
+            self._iniciar_vigilancia(self.cfg["carpeta_vigilada"])
+        self.cola.iniciar()
+        if self.cfg.get("api_activa"):
+            self._api = ServidorAPI(self.almacen, self.cola, self.cfg, os.path.join(self.tmpdir, "api"))
+            self._api.iniciar_en_hilo()
+        self.after(1000, self._seguir_revision)
+
+    def _arranque_listo(self) -> None:
+        marcar_arranque("interactiva")
+        self.lbl_arranque.configure(text=f"Inicio en {ARRANQUE[-1][1]:.2f} s")
+        self._mostrar_motor()
+        if "--medir-arranque" in sys.argv:
+            print("Arranque:", resumen_arranque())
+            self.after(50, self._al_cerrar)
+            return
+        self._render_pendientes()
+
+    def _mostrar_motor(self) -> None:
+        """Informa el backend de OCR elegido en cuanto termina la detección (corre en otro hilo)."""
+        if MOTOR_OCR.backend is None:
+            self.after(200, self._mostrar_motor)
+            return
+        self.lbl_motor.configure(text=MOTOR_OCR.descripcion(),
+                                 foreground="" if MOTOR_OCR.disponible() else "#e0a030")
+        print(MOTOR_OCR.descripcion())
 
     # ---------------- UI ----------------
     def _build_ui(self) -> None:
@@ -161,18 +3071,31 @@ class ClasificadorApp(tk.Tk):
         ttk.Label(self.sidebar, text="Panel de Control", font=("Segoe UI", 14, "bold")).pack(pady=(0, 12))
         ttk.Label(self.sidebar, text="Día de trabajo").pack(anchor="w")
 
-        ttk.Combobox(self.sidebar, textvariable=self.dia, values=self.dias, state="readonly").pack(fill="x", pady=6)
+        self.cb_dia = ttk.Combobox(self.sidebar, textvariable=self.dia, values=self._opciones_dia(), state="readonly")
+        self.cb_dia.pack(fill="x", pady=6)
+
+        ttk.Label(self.sidebar, text="Cliente del lote").pack(anchor="w")
+        ttk.Combobox(
+            self.sidebar, textvariable=self.cliente_lote,
+            values=[CLIENTE_AUTO] + TARIFAS.clientes, state="readonly"
+        ).pack(fill="x", pady=(2, 6))
 
         ttk.Button(self.sidebar, text="📸 Cargar imágenes", command=self.cargar_imgs).pack(fill="x", pady=4)
         ttk.Button(self.sidebar, text="🗜️ Cargar .ZIP", command=self.cargar_zip).pack(fill="x", pady=4)
+        self.btn_vigilar = ttk.Button(self.sidebar, text="👁️ Vigilar carpeta", command=self.toggle_vigilancia)
+        self.btn_vigilar.pack(fill="x", pady=4)
+        self.lbl_vigilancia = ttk.Label(self.sidebar, text="", wraplength=220)
+        self.lbl_vigilancia.pack(anchor="w")
 
         ttk.Separator(self.sidebar).pack(fill="x", pady=8)
 
         ttk.Button(self.sidebar, text="🧮 Exportar Excel (resumen)", command=self.export_excel).pack(fill="x", pady=4)
         ttk.Button(self.sidebar, text="📦 Exportar Detallado XLS (agrupado)", command=self.export_detallado_excel).pack(fill="x", pady=4)
         ttk.Button(self.sidebar, text="📝 Exportar Detallado MD (agrupado)", command=self.export_detallado_markdown).pack(fill="x", pady=4)
+        ttk.Button(self.sidebar, text="🗂️ Exportar Detallado (todos los formatos)", command=self.export_detallado_todo).pack(fill="x", pady=4)
 
-        ttk.Button(self.sidebar, text="♻️ Reset Semana", command=self.reset_sem).pack(fill="x", pady=4)
+        ttk.Button(self.sidebar, text="📚 Historial de semanas", command=self.ver_historial).pack(fill="x", pady=4)
+        ttk.Button(self.sidebar, text="♻️ Cerrar/Reset Semana", command=self.reset_sem).pack(fill="x", pady=4)
 
         ttk.Separator(self.sidebar).pack(fill="x", pady=6)
 
@@ -182,14 +3105,14 @@ class ClasificadorApp(tk.Tk):
 
         ttk.Label(row_reset_dia, text="🧹 Resetear día:").pack(side="left")
 
-        cb_reset = ttk.Combobox(
+        self.cb_reset = ttk.Combobox(
             row_reset_dia,
             textvariable=self.reset_dia_var,
-            values=self.dias,
+            values=self._opciones_dia(),
             state="readonly",
-            width=14
+            width=20
         )
-        cb_reset.pack(side="left", padx=6)
+        self.cb_reset.pack(side="left", padx=6)
 
         ttk.Button(
             row_reset_dia,
@@ -200,10 +3123,23 @@ class ClasificadorApp(tk.Tk):
         ttk.Separator(self.sidebar).pack(fill="x", pady=8)
 
         self.progress = ttk.Progressbar(self.sidebar, length=200)
-        self.progress.pack(pady=(4, 8))
+        self.progress.pack(pady=(4, 2))
+        self.lbl_cola = ttk.Label(self.sidebar, text="")
+        self.lbl_cola.pack(anchor="w", pady=(0, 6))
 
         self.lbl_pend = ttk.Label(self.sidebar, text="Pendientes: 0", font=("Segoe UI", 10, "bold"))
         self.lbl_pend.pack(anchor="w")
+        self.btn_reclasificar = ttk.Button(self.sidebar, text="🔁 Reclasificar pendientes", command=self.reclasificar)
+        self.btn_reclasificar.pack(fill="x", pady=(4, 0))
+
+        ttk.Label(
+            self.sidebar,
+            text=f"Tarifas v{TARIFAS.version} (vigentes desde {TARIFAS.desde[-1]})"
+        ).pack(anchor="w", pady=(4, 0))
+        self.lbl_arranque = ttk.Label(self.sidebar, text="")
+        self.lbl_arranque.pack(anchor="w")
+        self.lbl_motor = ttk.Label(self.sidebar, text="OCR: detectando…", wraplength=240)
+        self.lbl_motor.pack(anchor="w")
 
         # Panel principal scrollable
         self.canvas = tk.Canvas(self, highlightthickness=0, bg="#222")
@@ -217,88 +3153,220 @@ class ClasificadorApp(tk.Tk):
         self.canvas.create_window((0, 0), window=self.main_frame, anchor="nw")
         self.main_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
 
+        fila_vista = ttk.Frame(self.main_frame)
+        fila_vista.pack(fill="x", pady=(0, 6))
+        ttk.Label(fila_vista, text="Resumen de:").pack(side="left")
+        cb_vista = ttk.Combobox(
+            fila_vista, textvariable=self.cliente_vista,
+            values=[CLIENTE_TODOS] + TARIFAS.clientes, state="readonly", width=28
+        )
+        cb_vista.pack(side="left", padx=6)
+        cb_vista.bind("<<ComboboxSelected>>", lambda e: self._render_tabla())
+
         self.tbl_frame = ttk.Frame(self.main_frame)
         self.tbl_frame.pack(fill="x", pady=(0, 12))
 
         self.pend_frame = ttk.Frame(self.main_frame)
         self.pend_frame.pack(fill="x")
 
+    # ---------------- Reclasificación de pendientes ----------------
+    def reclasificar(self) -> None:
+        """Re-empareja los pendientes con el clasificador actual, en segundo plano (ver Almacen)."""
+        if self._reclasificacion is not None or not self.almacen.pendientes:
+            return
+        fecha, cliente = self._fecha_sel(), self._cliente_elegido()
+        self._reclasificacion = queue.Queue()
+        self.btn_reclasificar.configure(state="disabled", text="🔁 Reclasificando…")
+
+        def correr(q=self._reclasificacion):
+            try:
+                q.put(self.almacen.reclasificar_pendientes(fecha, cliente, self.cfg.get("cola_workers", 2)))
+            except Exception as e:
+                q.put(e)
+
+        threading.Thread(target=correr, name="reclasificar", daemon=True).start()
+        self.after(300, self._seguir_reclasificacion)
+
+    def _seguir_reclasificacion(self) -> None:
+        try:
+            res = self._reclasificacion.get_nowait()
+        except queue.Empty:
+            self.after(300, self._seguir_reclasificacion)
+            return
+        self._reclasificacion = None
+        self.btn_reclasificar.configure(state="normal", text="🔁 Reclasificar pendientes")
+        self._refrescar()
+        if isinstance(res, Exception):
+            messagebox.showerror("Error", f"No se pudo reclasificar: {res}")
+            return
+        messagebox.showinfo(
+            "Reclasificación",
+            f"Resueltas: {res['resueltas']} · A revisar: {res['a_revisar']} · Duplicadas: {res['duplicadas']}\n"
+            f"Siguen pendientes: {res['siguen']} (releídas con OCR: {res['releidas']}, "
+            f"archivos que ya no están: {res['faltan']})"
+        )
+
     # ---------------- Carga/Procesamiento ----------------
     def cargar_imgs(self) -> None:
         files = filedialog.askopenfilenames(filetypes=[("Imágenes", "*.jpg;*.jpeg;*.png")])
         if files:
-            self._procesar(files)
+            self._encolar(files)
 
     def cargar_zip(self) -> None:
-        path = filedialog.askopenfilename(filetypes=[("ZIP files", "*.zip")])
-        if not path:
+        paths = filedialog.askopenfilenames(filetypes=[("ZIP files", "*.zip")])
+        if paths:
+            self._encolar(paths)  # cada ZIP se expande en la cola
+
+    def _encolar(self, paths) -> None:
+        tid = self.cola.agregar(paths, self._fecha_sel(), self._cliente_elegido())
+        if tid is None:
+            messagebox.showwarning(
+                "Cola llena",
+                f"Hay {self.cola.en_espera()} imágenes esperando. Probá de nuevo cuando avance la cola."
+            )
             return
+        self._seguir_cola()
+
+    def _seguir_cola(self) -> None:
+        """Barra de progreso con los lotes en curso y aviso de los que terminaron."""
+        hechas, total = self.cola.progreso()
+        self.progress.configure(maximum=max(total, 1), value=hechas)
+        self.lbl_cola.configure(text=f"Cola: {hechas}/{total} imágenes" if total else "")
+
+        avisos = []
+        for t in self.cola.tomar_terminados("ui"):
+            omitidas, duplicados, errores = t["omitidas"], t["duplicados"], t["errores"]
+            if omitidas:
+                avisos.append(f"Se omitieron {omitidas} imágenes ya procesadas anteriormente.")
+            if duplicados:
+                avisos.append(
+                    f"Se omitieron {len(duplicados)} etiquetas con N° de envío ya registrado:\n"
+                    + "\n".join(duplicados[:15]) + ("\n…" if len(duplicados) > 15 else "")
+                )
+            if errores:
+                avisos.append(f"No se pudieron procesar {len(errores)} archivos:\n" + "\n".join(errores[:15]))
+        if avisos:
+            messagebox.showinfo("Imágenes omitidas", "\n\n".join(avisos))
+
+    def _cliente_elegido(self):
+        """Cliente elegido para el lote; None en automático (el reconocido en la etiqueta o el por defecto)."""
+        elegido = self.cliente_lote.get()
+        return None if elegido == CLIENTE_AUTO else elegido
+
+    def _refrescar(self, pendientes: bool = True) -> None:
+        """
+        Selectores de día, tabla y (si se pide) pendientes tras un cambio en los datos. El panel de
+        pendientes se rearma sólo si cambió lo que muestra: durante un lote rev sube a cada guardado y
+        rearmarlo borraría el cordón o la subregión que el operador está cargando.
+        """
+        self._rev_visto = self.almacen.rev
+        opciones = self._opciones_dia()
+        self.cb_dia.configure(values=opciones)
+        self.cb_reset.configure(values=opciones)
+        self._render_tabla()
+        if pendientes and self._estado_pendientes() != self._pend_visto:
+            self._render_pendientes()
+        self._update_pend_count()
 
-        out = os.path.join(self.tmpdir, datetime.now().strftime("%Y%m%d_%H%M%S"))
-        os.makedirs(out, exist_ok=True)
-
-        with zipfile.ZipFile(path, "r") as z:
-            z.extractall(out)
-
-        imgs = [
-            os.path.join(r, f)
-            for r, _, fs in os.walk(out)
-            for f in fs
-            if f.lower().endswith((".jpg", ".jpeg", ".png"))
-        ]
-
-        if not imgs:
-            messagebox.showwarning("ZIP vacío", "No se encontraron imágenes dentro del ZIP.")
+    def _estado_pendientes(self) -> tuple:
+        """Lo que muestra el panel de pendientes: (rutas pendientes, filas a revisar como (fecha, Src, ts))."""
+        return (set(self.almacen.pendientes),
+                {(f, fila.Src, fila.ts) for f, fila in self.almacen.filas_a_revisar()})
+
+    def _seguir_revision(self) -> None:
+        """La cola, la API u otro proceso cambian los datos por fuera de la UI: se redibuja si hubo cambios."""
+        self.almacen.sincronizar()
+        if self.almacen.rev != self._rev_visto:
+            self._refrescar()
+        self._seguir_cola()
+        self.after(1000, self._seguir_revision)
+
+    # ---------------- Vigilancia de carpeta ----------------
+    def toggle_vigilancia(self) -> None:
+        if self._vigilante is not None:
+            self._detener_vigilancia()
+            self.cfg["vigilancia_activa"] = False
+            save_json(CONFIG_FILE, self.cfg)
             return
 
-        self._procesar(imgs)
-
-    def _procesar(self, paths) -> None:
-        dia = self.dia.get()
-        self.progress.configure(maximum=len(paths), value=0)
-
-        for i, p in enumerate(paths, 1):
-            try:
-                img = Image.open(p)
-                txt = ocr_con_rotaciones(img)
-                cordon, ciudad, sub = identificar_cordon_por_ciudad(txt)
-
-                if cordon == "cordon_no_identificado":
-                    if p not in self.pendientes:
-                        self.pendientes.append(p)
-                else:
-                    # Contador por día/cordón
-                    self.data[dia][cordon] = self.data[dia].get(cordon, 0) + 1
-                    # Fila detallada SIEMPRE (aunque subregión esté vacía)
-                    self._append_detalle(
-                        dia=dia,
-                        cordon=cordon,
-                        ciudad=ciudad or "",
-                        subregion=sub or "",
-                        src_path=p,
-                        manual=False,
-                    )
-
-            except Exception as e:
-                print("Error procesando:", p, e)
-
-            self.progress.configure(value=i)
-            self.update_idletasks()
-
-        # Guardar persistencia
-        save_json(DATA_FILE, self.data)
-        save_json(SUBREG_FILE, self.subregs)
-        save_json(PEND_FILE, self.pendientes)
+        carpeta = filedialog.askdirectory(
+            title="Carpeta a vigilar (descargas de WhatsApp)",
+            initialdir=self.cfg.get("carpeta_vigilada") or os.getcwd(),
+        )
+        if not carpeta:
+            return
+        self.cfg["carpeta_vigilada"] = carpeta
+        self.cfg["vigilancia_activa"] = True
+        self.cfg["vigilancia_desde"] = datetime.now().isoformat(timespec="seconds")
+        save_json(CONFIG_FILE, self.cfg)
+        self._iniciar_vigilancia(carpeta)
 
-        self._render_tabla()
-        self._render_pendientes()
-        self._update_pend_count()
+    def _iniciar_vigilancia(self, carpeta: str) -> None:
+        try:
+            desde = datetime.fromisoformat(self.cfg.get("vigilancia_desde") or "").timestamp()
+        except ValueError:
+            desde = time.time()  # config vieja: lo que ya está en la carpeta no se toma
+        self._vigilante = VigilanteCarpeta(
+            carpeta,
+            on_listo=self._vigilado_listo,
+            intervalo=float(self.cfg.get("vigilancia_intervalo_s", 2.0)),
+            estabilidad=float(self.cfg.get("vigilancia_estabilidad_s", 3.0)),
+            desde=desde,
+        )
+        self._vigilante.iniciar()
+        self.btn_vigilar.configure(text="⏹️ Detener vigilancia")
+        modo = "eventos" if WATCHDOG else "sondeo"
+        self.lbl_vigilancia.configure(text=f"Vigilando ({modo}): {carpeta}")
+        self._after_vigilancia = self.after(500, self._drenar_vigilancia)
+
+    def _detener_vigilancia(self) -> None:
+        if self._vigilante is not None:
+            self._vigilante.detener()
+            self._vigilante = None
+        if self._after_vigilancia is not None:
+            self.after_cancel(self._after_vigilancia)
+            self._after_vigilancia = None
+        self.btn_vigilar.configure(text="👁️ Vigilar carpeta")
+        self.lbl_vigilancia.configure(text="")
+
+    def _vigilado_listo(self, path: str) -> None:
+        """Corre en el hilo del vigilante: descarta lo ya procesado (la pasada inicial lo reencuentra)."""
+        if not self.almacen.procesados.ya_procesado(path):
+            self._vigilados.put(path)
+
+    def _drenar_vigilancia(self) -> None:
+        """Pasa a la cola de lotes lo que dejó el vigilante (cuenta en la fecha de hoy)."""
+        self._encolar_vigilados()
+        self._after_vigilancia = self.after(1000, self._drenar_vigilancia) if self._vigilante is not None else None
+
+    def _encolar_vigilados(self) -> None:
+        try:
+            while True:
+                self._vigilados_en_espera.append(self._vigilados.get_nowait())
+        except queue.Empty:
+            pass
+        if not self._vigilados_en_espera:
+            return
+        tid = self.cola.agregar(self._vigilados_en_espera, date.today().isoformat(),
+                                self._cliente_elegido(), origen="vigilancia")
+        if tid is not None:
+            self._vigilados_en_espera = []
+            self._seguir_cola()
+
+    def _al_cerrar(self) -> None:
+        self._detener_vigilancia()
+        self._encolar_vigilados()  # lo que no entre queda en la carpeta: la pasada inicial lo retoma
+        if self._api is not None:
+            self._api.detener()
+        self.cola.detener()
+        self.destroy()
 
     # ---------------- Pendientes ----------------
     def _render_pendientes(self) -> None:
         for w in self.pend_frame.winfo_children():
             w.destroy()
         self._img_refs_pend.clear()
+        self._pend_visto = self._estado_pendientes()
 
         ttk.Label(
             self.pend_frame,
@@ -306,13 +3374,13 @@ class ClasificadorApp(tk.Tk):
             font=("Segoe UI", 12, "bold")
         ).pack(anchor="w", pady=(0, 8))
 
-        if not self.pendientes:
+        self._render_dudosas()
+
+        if not self.almacen.pendientes:
             ttk.Label(self.pend_frame, text="🎉 No hay imágenes pendientes.").pack(anchor="w", pady=5)
             return
 
-        dia_actual = self.dia.get()
-
-        for path in list(self.pendientes):
+        for path in list(self.almacen.pendientes):
             if not os.path.exists(path):
                 # Si el archivo ya no existe, lo omitimos
                 continue
@@ -356,35 +3424,61 @@ class ClasificadorApp(tk.Tk):
                         messagebox.showwarning("Atención", "Seleccioná un cordón válido.")
                         return
 
-                    # Sumar contador
-                    self.data[dia_actual][cordon_sel] = self.data[dia_actual].get(cordon_sel, 0) + 1
-
-                    # Guardar detalle con el cordón elegido; ciudad vacía si no la sabemos.
-                    self._append_detalle(
-                        dia=dia_actual,
-                        cordon=cordon_sel,
-                        ciudad="",
-                        subregion=(subr if subr and "opcional" not in subr.lower() else ""),
-                        src_path=ruta,
-                        manual=True,
-                    )
-
-                    # Limpiar pendiente
-                    if ruta in self.pendientes:
-                        self.pendientes.remove(ruta)
+                    self._pend_visto[0].discard(ruta)  # el panel ya no la muestra: no hace falta rearmarlo
+                    with self.almacen.lock:
+                        if ruta not in self.almacen.pendientes:
+                            container.destroy()  # ya confirmado por otro medio (API)
+                            return
+                        self.almacen.confirmar_pendiente(
+                            ruta, self._fecha_sel(), cordon_sel,
+                            subregion=(subr if subr and "opcional" not in subr.lower() else ""),
+                            cliente=self._cliente_elegido(),
+                        )
+                        self.almacen.persistir()
 
                     container.destroy()
-                    save_json(DATA_FILE, self.data)
-                    save_json(SUBREG_FILE, self.subregs)
-                    save_json(PEND_FILE, self.pendientes)
-                    self._render_tabla()
-                    self._update_pend_count()
+                    self._refrescar(pendientes=False)
 
                 ttk.Button(row2, text="Confirmar", command=confirmar).pack(side="left")
 
             except Exception as e:
                 print("Error mostrando pendiente:", e)
 
+    def _render_dudosas(self) -> None:
+        """Filas contadas con confianza intermedia: se confirman (o corrigen) sin volver a cargarlas."""
+        dudosas = self.almacen.filas_a_revisar()
+        if not dudosas:
+            return
+        ttk.Label(
+            self.pend_frame,
+            text=f"Aceptadas con duda ({len(dudosas)})",
+            font=("Segoe UI", 10, "bold")
+        ).pack(anchor="w", pady=(0, 4))
+
+        for fecha, fila in dudosas:
+            cont = ttk.Frame(self.pend_frame, padding=(6, 2))
+            cont.pack(fill="x")
+            ttk.Label(
+                cont, width=60,
+                text=f"{etiqueta_fecha(fecha)} · {os.path.basename(fila.Src)} · {fila.Ciudad} "
+                     f"({fila.Confianza or 0:.0%})"
+            ).pack(side="left")
+            cb = ttk.Combobox(cont, values=list(CORDONES.keys()), width=24, state="readonly")
+            cb.set(fila.Cordon)
+            cb.pack(side="left", padx=5)
+
+            def confirmar(cbox=cb, f=fecha, src=fila.Src, ts=fila.ts, container=cont):
+                self._pend_visto[1].discard((f, src, ts))
+                with self.almacen.lock:
+                    if self.almacen.revisar_fila(f, src, ts, cbox.get()):
+                        self.almacen.persistir()
+                container.destroy()
+                self._refrescar(pendientes=False)
+
+            ttk.Button(cont, text="Confirmar", command=confirmar).pack(side="left")
+
+        ttk.Separator(self.pend_frame).pack(fill="x", pady=8)
+
     # ---------------- Tabla resumen (conteo por día/cordón) ----------------
     def _render_tabla(self) -> None:
         for w in self.tbl_frame.winfo_children():
@@ -392,29 +3486,28 @@ class ClasificadorApp(tk.Tk):
 
         # Columnas: Día, cordones (conteos), Paquetes Día (total de conteos), Total $ Día
         headers = ["Día"] + list(PRECIOS.keys()) + ["Paquetes Día", "Total $ Día"]
-        table = ttk.Treeview(self.tbl_frame, columns=headers, show="headings", height=6)
+        table = ttk.Treeview(self.tbl_frame, columns=headers, show="headings", height=7)
 
         for h in headers:
             table.heading(h, text=h)
             # un poco más angosto para cordones y más ancho para totales
             width = 120 if h in PRECIOS else (140 if h == "Día" else 140)
-            table.column(h, width=width, anchor="center")
+            table.column(h, width=(170 if h == "Día" else width), anchor="center")
 
         table.pack(fill="x")
 
-        total_sem_pesos = 0
-        total_sem_paquetes = 0
-
-        for dia, vals in self.data.items():
-            paquetes_dia = sum(vals.values())
-            total_dia_pesos = sum(PRECIOS.get(c, 0) * n for c, n in vals.items())
-
-            total_sem_paquetes += paquetes_dia
-            total_sem_pesos += total_dia_pesos
-
-            row = [dia] + [vals.get(c, 0) for c in PRECIOS] + [paquetes_dia, f"${total_dia_pesos:,}"]
+        res = self._resumen()
+        for i, fecha in enumerate(res["fechas"]):
+            row = (
+                [etiqueta_fecha(fecha)]
+                + res["conteos"][i].tolist()
+                + [int(res["paquetes"][i]), f"${int(res['importes'][i]):,}"]
+            )
             table.insert("", "end", values=row)
 
+        total_sem_pesos = res["total_importe"]
+        total_sem_paquetes = res["total_paquetes"]
+
         # Pie con totales semanales (lado a lado)
         footer = ttk.Frame(self.tbl_frame)
         footer.pack(fill="x", pady=(6, 0))
@@ -432,19 +3525,27 @@ class ClasificadorApp(tk.Tk):
         ).pack(side="left")
 
     # ---------------- Exportar (resumen por día) ----------------
-    def export_excel(self) -> None:
-        # Estructurar DataFrame con conteos por cordón
-        df = pd.DataFrame.from_dict(self.data, orient="index")
-        for c in PRECIOS:
-            if c not in df:
-                df[c] = 0
-        df = df[list(PRECIOS.keys())]  # ordenar columnas
-
-        # NUEVO: Paquetes Día (suma de conteos)
-        df["Paquetes Día"] = df[list(PRECIOS.keys())].sum(axis=1)
+    def _resumen(self) -> dict:
+        """
+        Totales por fecha (ver resumir) de lunes a sábado de la semana en curso más cualquier otra
+        fecha con datos; se recalculan sólo cuando cambian los datos.
+        """
+        semana = fechas_semana(date.today())
+        cliente = self.cliente_vista.get()
+        clave = (self.almacen.rev, semana[0], cliente)  # también se invalida al empezar otra semana
+        cache_clave, res = self._resumen_cache
+        if cache_clave != clave:
+            with self.almacen.lock:
+                res = self.almacen.resumen(sorted(set(semana) | set(self.almacen.data)), cliente)
+            self._resumen_cache = (clave, res)
+        return res
 
-        # Total monetario del día
-        df["Total $ Día"] = df.apply(lambda r: sum(PRECIOS[c] * r.get(c, 0) for c in PRECIOS), axis=1)
+    def export_excel(self) -> None:
+        # Mismos totales que la tabla: conteos por cordón, Paquetes Día y Total $ Día
+        res = self._resumen()
+        df = pd.DataFrame(res["conteos"], index=[etiqueta_fecha(f) for f in res["fechas"]], columns=res["cordones"])
+        df["Paquetes Día"] = res["paquetes"]
+        df["Total $ Día"] = res["importes"]
 
         path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", ".xlsx")])
         if path:
@@ -452,159 +3553,130 @@ class ClasificadorApp(tk.Tk):
             messagebox.showinfo("Éxito", f"Archivo guardado en {path}")
 
     # ---------------- Exportación detallada AGRUPADA (tipo Presis) ----------------
-    def export_detallado_excel(self) -> None:
-        rows = self._build_detalle_rows()
-        if not rows:
+    def _detalle_agrupado(self):
+        """DataFrame agrupado del detallado; se reconstruye sólo si los datos cambiaron desde la última vez."""
+        rev, agg = self._detalle_cache
+        if rev != self.almacen.rev:
+            with self.almacen.lock:
+                rev = self.almacen.rev
+                rows = self.almacen.filas_detalle()
+            agg = agrupar_detalle(rows, self.almacen.remitos) if rows else None
+            self._detalle_cache = (rev, agg)
+        return agg
+
+    def _exportar_detallado(self, formatos, defaultextension: str, filetypes) -> None:
+        agg = self._detalle_agrupado()
+        if agg is None:
             messagebox.showwarning("Sin datos", "No hay filas detalladas para exportar.")
             return
 
-        df = pd.DataFrame(rows)
-        group_cols = ["Fecha", "Día", "Cordón", "Localidad", "Domicilio", "Importe_unitario"]
-        agg = df.groupby(group_cols, as_index=False).size().rename(columns={"size": "Cantidad"})
-        agg["Cliente"] = "bazar gadol"
-        agg["Importe"] = agg["Importe_unitario"] * agg["Cantidad"]
-
-        # IDs simples correlativos
-        agg = agg.reset_index(drop=True)
-        agg["Remito"] = ["RM" + str(i + 1).zfill(8) for i in range(len(agg))]
-        agg["Guía Agente"] = ["GA" + str(i + 1).zfill(8) for i in range(len(agg))]
+        path = filedialog.asksaveasfilename(defaultextension=defaultextension, filetypes=filetypes)
+        if not path:
+            return
 
-        final_cols = ["Fecha", "Día", "Cliente", "Remito", "Guía Agente",
-                      "Cordón", "Localidad", "Domicilio", "Cantidad", "Importe"]
-        out = agg[final_cols]
+        escritos, errores = exportar_detalle(agg, path, formatos)
+        if errores:
+            messagebox.showwarning("Exportación incompleta", "\n".join(errores))
+        if escritos:
+            messagebox.showinfo("Éxito", "Archivo(s) guardado(s):\n" + "\n".join(escritos))
 
-        path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", ".xlsx")])
-        if path:
-            out.to_excel(path, index=False)
-            messagebox.showinfo("Éxito", f"Archivo detallado guardado en {path}")
+    def export_detallado_excel(self) -> None:
+        self._exportar_detallado(["xlsx"], ".xlsx", [("Excel", ".xlsx")])
 
     def export_detallado_markdown(self) -> None:
-        rows = self._build_detalle_rows()
-        if not rows:
-            messagebox.showwarning("Sin datos", "No hay filas detalladas para exportar.")
-            return
+        self._exportar_detallado(["md"], ".md", [("Markdown", ".md")])
 
-        df = pd.DataFrame(rows)
-        group_cols = ["Fecha", "Día", "Cordón", "Localidad", "Domicilio", "Importe_unitario"]
-        agg = df.groupby(group_cols, as_index=False).size().rename(columns={"size": "Cantidad"})
-        agg["Cliente"] = "bazar gadol"
-        agg["Importe"] = agg["Importe_unitario"] * agg["Cantidad"]
+    def export_detallado_todo(self) -> None:
+        # Un solo agrupado → xlsx, csv, parquet y md con el mismo nombre base
+        self._exportar_detallado(list(ESCRITORES_DETALLE), ".xlsx", [("Nombre base", "*.*")])
 
-        final_cols = ["Fecha", "Día", "Cliente", "Cordón", "Localidad", "Domicilio", "Cantidad", "Importe"]
-        out = agg[final_cols]
+    # ---------------- Historial ----------------
+    def ver_historial(self) -> None:
+        semanas = self.almacen.historial.semanas()
+        if not semanas:
+            messagebox.showinfo("Historial", "Todavía no hay semanas archivadas.")
+            return
 
-        md_parts = []
-        md_parts.append("# 📦 Exportación detallada de entregas (agrupado)\n")
-        md_parts.append(out.to_markdown(index=False, tablefmt="github"))
+        win = tk.Toplevel(self)
+        win.title("Historial de semanas")
+        win.geometry("1000x420")
 
-        path = filedialog.asksaveasfilename(defaultextension=".md", filetypes=[("Markdown", ".md")])
-        if path:
-            with open(path, "w", encoding="utf-8") as f:
-                f.write("\n".join(md_parts))
-            messagebox.showinfo("Éxito", f"Archivo Markdown guardado en {path}")
+        headers = ["Semana"] + list(PRECIOS.keys()) + ["Paquetes", "Total $"]
+        table = ttk.Treeview(win, columns=headers, show="headings", selectmode="extended")
+        for h in headers:
+            table.heading(h, text=h)
+            table.column(h, width=120 if h in PRECIOS else 110, anchor="center")
+        table.pack(fill="both", expand=True, padx=10, pady=10)
+
+        for sem in reversed(semanas):
+            e = self.almacen.historial.indice[sem]
+            table.insert("", "end", iid=sem, values=(
+                [sem] + [e["por_cordon"].get(c, 0) for c in PRECIOS] + [e["paquetes"], f"${e['importe']:,}"]
+            ))
+
+        lbl_tot = ttk.Label(win, font=("Segoe UI", 11, "bold"))
+        lbl_tot.pack(anchor="w", padx=10)
+
+        def actualizar_totales(*_):
+            sel = list(table.selection()) or semanas
+            tot = self.almacen.historial.totales(sel)
+            lbl_tot.configure(
+                text=f"{len(sel)} semana(s) — 📦 {tot['paquetes']:,} paquetes — 💰 ${tot['importe']:,}"
+            )
+
+        def exportar_seleccion():
+            sel = sorted(table.selection()) or semanas
+            rows = []
+            for sem in sel:
+                rows.extend(construir_filas_detalle(self.almacen.historial.cargar(sem)["subregs"]))
+            if not rows:
+                messagebox.showwarning("Sin datos", "Las semanas elegidas no tienen filas detalladas.", parent=win)
+                return
+            path = filedialog.asksaveasfilename(parent=win, defaultextension=".xlsx", filetypes=[("Excel", ".xlsx")])
+            if not path:
+                return
+            escritos, errores = exportar_detalle(agrupar_detalle(rows, self.almacen.remitos), path, ["xlsx"])
+            if errores:
+                messagebox.showwarning("Exportación incompleta", "\n".join(errores), parent=win)
+            if escritos:
+                messagebox.showinfo("Éxito", f"Archivo detallado guardado en {escritos[0]}", parent=win)
+
+        table.bind("<<TreeviewSelect>>", actualizar_totales)
+        actualizar_totales()
+        ttk.Button(win, text="📦 Exportar detallado de las semanas seleccionadas",
+                   command=exportar_seleccion).pack(anchor="e", padx=10, pady=8)
 
     # ---------------- Utilidades ----------------
-    def _buscar_cordon_por_ciudad(self, ciudad: str) -> str:
-        for c, lista in CORDONES.items():
-            if ciudad and ciudad.upper() in lista:
-                return c
-        return "cordon_no_identificado"
-
-    def _append_detalle(self, dia: str, cordon: str, ciudad: str, subregion: str,
-                        src_path: str = "", manual: bool = False) -> None:
-        from datetime import datetime as _dt
-        row = {
-            "Cordon": cordon,
-            "Ciudad": (ciudad or ""),
-            "Subregión": (subregion or ""),
-            "Src": src_path or "",
-            "Manual": bool(manual),
-            "ts": _dt.now().isoformat(timespec="seconds"),
-        }
-        self.subregs[dia].append(row)
+    def _opciones_dia(self) -> list:
+        """Etiquetas "Día dd/mm/aaaa" de lunes a sábado de esta semana, hoy y cualquier fecha con datos."""
+        fechas = set(fechas_semana(date.today())) | {date.today().isoformat()} | set(self.almacen.fechas)
+        return [etiqueta_fecha(f) for f in sorted(fechas)]
 
-    def _migrate_subregs_schema(self):
-        """
-        Garantiza que cada entrada tenga: Cordon, Ciudad, Subregión, Src, Manual, ts
-        y completa Cordon si falta (buscando por Ciudad).
-        """
-        changed = False
-        for dia, items in self.subregs.items():
-            new_items = []
-            for s in items:
-                cordon = s.get("Cordon")
-                ciudad = s.get("Ciudad", "") or ""
-                subreg = s.get("Subregión", "") or ""
-                src = s.get("Src", "")
-                manual = bool(s.get("Manual", False))
-                ts = s.get("ts")
-
-                if not cordon:
-                    cordon = self._buscar_cordon_por_ciudad(ciudad)
-                    if cordon not in PRECIOS:
-                        cordon = "cordon_no_identificado"
-                    changed = True
-
-                if not ts:
-                    from datetime import datetime as _dt
-                    ts = _dt.now().isoformat(timespec="seconds")
-                    changed = True
-
-                new_items.append({
-                    "Cordon": cordon,
-                    "Ciudad": ciudad,
-                    "Subregión": subreg,
-                    "Src": src,
-                    "Manual": manual,
-                    "ts": ts,
-                })
-            self.subregs[dia] = new_items
-        if changed:
-            save_json(SUBREG_FILE, self.subregs)
-
-    def _build_detalle_rows(self):
-        """
-        Devuelve lista de filas base para agrupar:
-        [ {Fecha, Día, Cordón, Localidad, Domicilio, Importe_unitario}, ... ]
-        """
-        rows = []
-        hoy = datetime.now().strftime("%d/%m/%Y")
-
-        for dia, items in self.subregs.items():
-            for s in items:
-                cordon = s.get("Cordon") or self._buscar_cordon_por_ciudad(s.get("Ciudad", ""))
-                if cordon not in PRECIOS:
-                    cordon = "cordon_no_identificado"
-                rows.append({
-                    "Fecha": hoy,
-                    "Día": dia,
-                    "Cordón": cordon,
-                    "Localidad": s.get("Ciudad", "") or "—",
-                    "Domicilio": s.get("Subregión", "") or "—",
-                    "Importe_unitario": PRECIOS.get(cordon, 0),
-                })
-        return rows
+    def _fecha_sel(self, var=None) -> str:
+        """Fecha ISO elegida en un selector de día (por defecto, el "Día de trabajo")."""
+        return fecha_de_etiqueta((var or self.dia).get())
 
     # ---------------- Reset ----------------
     def reset_sem(self) -> None:
-        if messagebox.askyesno("Confirmar", "¿Borrar todos los datos y pendientes?"):
-            self.data = {d: {} for d in self.dias}
-            self.subregs = {d: [] for d in self.dias}
-            self.pendientes.clear()
-
-            save_json(DATA_FILE, self.data)
-            save_json(SUBREG_FILE, self.subregs)
-            save_json(PEND_FILE, self.pendientes)
+        # Cada fecha se archiva en la partición de su semana ISO
+        semanas = ", ".join(sorted(self.almacen.semanas_abiertas())) or semana_iso(date.today())
 
-            self._render_tabla()
-            self._render_pendientes()
-            self._update_pend_count()
+        if messagebox.askyesno(
+            "Confirmar",
+            f"¿Archivar {semanas} en el historial y empezar una nueva semana?\n"
+            "(Se borran los datos actuales y los pendientes)"
+        ):
+            with self.almacen.lock:
+                self.almacen.cerrar_semanas()
+            self._refrescar()
 
     def reset_dia(self) -> None:
-        dia_sel = self.reset_dia_var.get()
-        if dia_sel not in self.dias:
+        try:
+            fecha_sel = self._fecha_sel(self.reset_dia_var)
+        except ValueError:
             messagebox.showwarning("Atención", "Seleccioná un día válido.")
             return
+        dia_sel = self.reset_dia_var.get()
 
         if not messagebox.askyesno(
             "Confirmar",
@@ -612,22 +3684,43 @@ class ClasificadorApp(tk.Tk):
         ):
             return
 
-        # Poner en cero el conteo y limpiar el detallado de ese día
-        self.data[dia_sel] = {}
-        self.subregs[dia_sel] = []
-
-        # Persistir y refrescar UI
-        save_json(DATA_FILE, self.data)
-        save_json(SUBREG_FILE, self.subregs)
-
-        self._render_tabla()
-        # Pendientes no están asociados a día: se dejan tal cual
+        with self.almacen.lock:
+            self.almacen.resetear_fecha(fecha_sel)
+        self._refrescar(pendientes=False)  # pendientes no están asociados a día: se dejan tal cual
 
         messagebox.showinfo("Listo", f"Se reseteó {dia_sel}.")
 
     def _update_pend_count(self) -> None:
-        self.lbl_pend.config(text=f"Pendientes: {len(self.pendientes)}")
+        dudosas = len(self.almacen.filas_a_revisar())
+        extra = f" · A revisar: {dudosas}" if dudosas else ""
+        self.lbl_pend.config(text=f"Pendientes: {len(self.almacen.pendientes)}{extra}")
 
 
 if __name__ == "__main__":
-    ClasificadorApp().mainloop()
+    marcar_arranque("módulo")
+    if "--reclasificar" in sys.argv:
+        # Sin ventana: re-emparejar los pendientes (p. ej. tras editar localidades.json) y salir
+        cfg = cargar_config()
+        MOTOR_OCR.configurar(cfg)
+        configurar_confianza(cfg)
+        almacen = Almacen()
+        print("Reclasificación:", almacen.reclasificar_pendientes(date.today().isoformat(), None,
+                                                                   cfg.get("cola_workers", 2)))
+    elif "--api" in sys.argv:
+        # Sin ventana: sólo la API HTTP sobre los mismos archivos de estado (puede correr junto a la
+        # ventana: comparten datos bajo BLOQUEO, cada uno con su propia cola de lotes)
+        cfg = cargar_config()
+        MOTOR_OCR.configurar(cfg)
+        print(MOTOR_OCR.descripcion())
+        configurar_confianza(cfg)
+        almacen = Almacen()
+        tmp = en_base("procesos_tmp")
+        cola = ColaTrabajos(almacen, TRABAJOS_API_FILE, os.path.join(tmp, "cola_api"),
+                            cfg.get("cola_workers", 2), cfg.get("cola_max_imagenes", 5000))
+        cola.iniciar()
+        try:
+            ServidorAPI(almacen, cola, cfg, os.path.join(tmp, "api")).servir()
+        finally:
+            cola.detener()
+    else:
+        ClasificadorApp().mainloop()
@@ -0,0 +1,27 @@
+# El script no es un paquete (nombre con espacios): se carga una vez por su ruta.
+import importlib.util
+import shutil
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="session")
+def flex():
+    spec = importlib.util.spec_from_file_location("flex", RAIZ / "FLEX TESSERACT 5.2 MEJORADO.py")
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@pytest.fixture
+def flex_tmp(tmp_path):
+    """El script cargado desde una carpeta temporal: su BASE_DIR (estado, bitácora, lock) es tmp_path."""
+    for nombre in ("FLEX TESSERACT 5.2 MEJORADO.py", "tarifas.json", "localidades.json"):
+        shutil.copy(RAIZ / nombre, tmp_path / nombre)
+    spec = importlib.util.spec_from_file_location("flex_tmp", tmp_path / "FLEX TESSERACT 5.2 MEJORADO.py")
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
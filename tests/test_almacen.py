@@ -0,0 +1,136 @@
+# Almacen sobre una carpeta temporal: cierre de semana, snapshot, migración y bitácora.
+
+
+def _resultado(path, cordon="Primer cordón", ciudad="LANUS", texto="", decision="auto"):
+    return {"path": str(path), "cordon": cordon, "ciudad": ciudad, "subregion": "", "envio": "",
+            "duplicado": False, "texto": texto, "confianza": 1.0, "decision": decision}
+
+
+def _imagen(tmp_path, nombre, contenido=b"imagen"):
+    p = tmp_path / nombre
+    p.write_bytes(contenido)
+    return str(p)
+
+
+def test_cerrar_semanas_libera_pendientes(flex_tmp, tmp_path):
+    alm = flex_tmp.Almacen()
+    pend = _imagen(tmp_path, "pend.jpg")
+    with alm.lock:
+        alm.aplicar_resultado("2025-10-06", _resultado(pend, "cordon_no_identificado", None,
+                                                       "ilegible", "pendiente"))
+        alm.procesados.registrar(pend)
+        alm.cerrar_semanas()
+
+    assert alm.pendientes == [] and alm.textos == {}
+    assert not alm.procesados.ya_procesado(pend)  # si se vuelve a cargar, se procesa
+
+
+def test_reclasificar_relee_localidades(flex_tmp, tmp_path):
+    alm = flex_tmp.Almacen()
+    pend = _imagen(tmp_path, "pend.jpg")
+    with alm.lock:
+        alm.aplicar_resultado("2025-10-06", _resultado(pend, "cordon_no_identificado", None,
+                                                       "Recibe: Ana\nVILLA INVENTADA", "pendiente"))
+    assert alm.reclasificar_pendientes("2025-10-06")["siguen"] == 1
+
+    # se agrega el barrio con la app abierta: la reclasificación lo usa sin reiniciar
+    ruta = tmp_path / "localidades.json"
+    loc = flex_tmp.json.loads(ruta.read_text(encoding="utf-8"))
+    loc["zonas"]["LANUS"].append("VILLA INVENTADA")
+    ruta.write_text(flex_tmp.json.dumps(loc), encoding="utf-8")
+
+    assert alm.reclasificar_pendientes("2025-10-06")["resueltas"] == 1
+    assert alm.pendientes == []
+    assert alm.data["2025-10-06"] == {"Primer cordón": 1}
+
+
+def _subregs_snapshot(flex):
+    return {
+        "2025-10-06": [
+            flex.FilaDetalle("Primer cordón", "LANUS", "Calle 1", "/img/a.jpg", False, "2025-10-06T10:00:00",
+                             "4455", "otro", 0.82, True),
+            flex.FilaDetalle("Segundo cordón", "QUILMES", "", "C:\\fotos\\b.jpg", True, "2025-10-06T11:00:00"),
+        ],
+        "2025-10-07": [],
+    }
+
+
+def test_snapshot_ida_y_vuelta(flex_tmp, tmp_path):
+    path = str(tmp_path / "estado.snap")
+    data = {"2025-10-06": {"Primer cordón": 1, "Segundo cordón": 1}}
+    flex_tmp.guardar_snapshot(path, data, _subregs_snapshot(flex_tmp), ["/img/p.jpg", "/img/q.jpg"],
+                              {"/img/p.jpg": "Recibe: Ana"})
+
+    data2, subregs, pendientes, textos = flex_tmp.cargar_snapshot(path)
+
+    assert data2 == data
+    assert {f: [r.a_dict() for r in filas] for f, filas in subregs.items()} == \
+        {f: [r.a_dict() for r in filas] for f, filas in _subregs_snapshot(flex_tmp).items()}
+    assert pendientes == ["/img/p.jpg", "/img/q.jpg"]
+    assert textos == {"/img/p.jpg": "Recibe: Ana"}
+
+
+def test_snapshot_esquema_1(flex_tmp, tmp_path, monkeypatch):
+    monkeypatch.setattr(flex_tmp, "MSGPACK", False)
+    path = tmp_path / "estado.snap"
+    flex_tmp.guardar_snapshot(str(path), {}, _subregs_snapshot(flex_tmp), ["/img/p.jpg"], {"/img/p.jpg": "x"})
+    # mismo cuerpo sin lo que agregaron los esquemas 2 (confianza/revisar) y 3 (texto de pendientes)
+    cab = flex_tmp._SNAPSHOT_CAB
+    cuerpo = flex_tmp.json.loads(flex_tmp.zlib.decompress(path.read_bytes()[cab.size:]))
+    for clave in ("confianza", "revisar"):
+        del cuerpo["filas"][clave]
+    del cuerpo["pendientes_texto"]
+    path.write_bytes(cab.pack(flex_tmp.SNAPSHOT_MAGIA, 1, 0)
+                     + flex_tmp.zlib.compress(flex_tmp.json.dumps(cuerpo).encode("utf-8")))
+
+    _, subregs, pendientes, textos = flex_tmp.cargar_snapshot(str(path))
+
+    fila = subregs["2025-10-06"][0]
+    assert (fila["Envio"], fila["Cliente"], fila["Confianza"], fila["Revisar"]) == ("4455", "otro", None, False)
+    assert subregs["2025-10-06"][1]["Src"] == "C:\\fotos\\b.jpg"
+    assert pendientes == ["/img/p.jpg"] and textos == {}
+
+
+def test_importar_json_por_dia_de_semana(flex_tmp, tmp_path):
+    (tmp_path / "data_semanal.json").write_text(flex_tmp.json.dumps(
+        {"Lunes": {"Primer cordón": 2}, "Martes": {}}), encoding="utf-8")
+    (tmp_path / "subregiones.json").write_text(flex_tmp.json.dumps({"Lunes": [
+        {"Cordon": "Primer cordón", "Ciudad": "LANUS", "Subregión": "Calle 1", "ts": "2025-10-06T10:00:00"},
+        {"Cordon": "", "Ciudad": "QUILMES", "ts": "2025-10-06T10:05:00"},
+    ]}), encoding="utf-8")
+    (tmp_path / "pendientes.json").write_text('["/img/p.jpg"]', encoding="utf-8")
+
+    alm = flex_tmp.Almacen()
+
+    assert alm.data == {"2025-10-06": {"Primer cordón": 2}}
+    filas = alm.subregs["2025-10-06"]
+    assert [(r["Cordon"], r["Ciudad"]) for r in filas] == [("Primer cordón", "LANUS"), ("Segundo cordón", "QUILMES")]
+    assert all(r["Cliente"] == flex_tmp.TARIFAS.cliente_defecto for r in filas)
+    assert alm.pendientes == ["/img/p.jpg"]
+    # la migración corre una sola vez: queda el snapshot y los JSON renombrados
+    assert (tmp_path / "estado.snap").exists()
+    assert sorted(p.name for p in tmp_path.glob("*.importado")) == \
+        ["data_semanal.json.importado", "pendientes.json.importado", "subregiones.json.importado"]
+    assert flex_tmp.Almacen().subregs["2025-10-06"][1]["Cordon"] == "Segundo cordón"
+
+
+def test_bitacora_se_reaplica_al_abrir(flex_tmp, tmp_path):
+    alm = flex_tmp.Almacen()
+    img, pend = _imagen(tmp_path, "a.jpg"), _imagen(tmp_path, "pend.jpg", b"otra")
+    with alm.lock:
+        alm.aplicar_resultado("2025-10-06", _resultado(img, texto="LANUS"))
+        alm.aplicar_resultado("2025-10-06", _resultado(pend, "cordon_no_identificado", None, "ilegible", "pendiente"))
+    # corte antes del guardado completo: sólo quedó la bitácora
+    assert flex_tmp.cargar_snapshot(str(tmp_path / "estado.snap"))[0] == {}
+
+    otra = flex_tmp.Almacen()
+
+    assert otra.data == {"2025-10-06": {"Primer cordón": 1}}
+    assert [r["Src"] for r in otra.subregs["2025-10-06"]] == [img]
+    assert otra.pendientes == [pend] and otra.textos == {pend: "ilegible"}
+    assert otra.procesados.ya_procesado(img)
+    # lo reaplicado quedó guardado y la bitácora vacía; releerla no duplica la fila
+    assert otra.bitacora.leer() == ([], 0)
+    assert otra._reaplicar({"op": "fila", "fecha": "2025-10-06",
+                            "fila": otra.subregs["2025-10-06"][0].a_dict()}) is False
+    assert otra.data == {"2025-10-06": {"Primer cordón": 1}}
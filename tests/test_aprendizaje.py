@@ -0,0 +1,26 @@
+# Lo aprendido de las confirmaciones manuales: alias y Bayes ingenuo.
+
+
+def test_alias_de_lectura_repetida(flex_tmp, tmp_path):
+    apr = flex_tmp.Aprendizaje(str(tmp_path / "aprendizaje.json"))
+    for _ in range(8):
+        apr.aprender("ZZZTOWN calle 123", "Primer cordón")
+    assert apr.predecir("algo ZZZTOWN") == ("Primer cordón", round(8 / 9, 3), "alias")
+
+
+def test_palabra_generica_no_es_alias(flex_tmp, tmp_path):
+    apr = flex_tmp.Aprendizaje(str(tmp_path / "aprendizaje.json"))
+    for _ in range(4):
+        apr.aprender("CALLE ZZZTOWN", "Primer cordón")
+        apr.aprender("CALLE YYYVILLE", "Cuarto cordón")
+    assert apr.predecir("CALLE sin ciudad") is None  # pocas confirmaciones para Bayes
+    assert apr.predecir("CALLE YYYVILLE")[0] == "Cuarto cordón"
+
+
+def test_guardar_y_releer(flex_tmp, tmp_path):
+    path = str(tmp_path / "aprendizaje.json")
+    apr = flex_tmp.Aprendizaje(path)
+    for _ in range(3):
+        apr.aprender("ZZZTOWN", "Segundo cordón")
+    apr.guardar()
+    assert flex_tmp.Aprendizaje(path).predecir("ZZZTOWN")[0] == "Segundo cordón"
@@ -0,0 +1,62 @@
+# Prueba de humo del detallado: filas base + agrupado (sin ventana ni OCR).
+import openpyxl
+import pytest
+
+
+
+def _subregs(flex):
+    return {
+        "2025-10-06": [
+            flex.FilaDetalle("Primer cordón", "LANUS", "Calle 1", ts="2025-10-06T10:00:00"),
+            flex.FilaDetalle("Primer cordón", "LANUS", "Calle 1", ts="2025-10-06T10:05:00"),
+            flex.FilaDetalle("Tercer cordón (CABA)", "CABA", "", ts="2025-10-06T11:00:00", Cliente="otro"),
+        ],
+        # semana archivada con el esquema viejo (clave = día de la semana, fecha desde el ts)
+        "Martes": [
+            {"Cordon": "", "Ciudad": "QUILMES", "Subregión": "Mitre 10", "ts": "2025-09-30T09:00:00"},
+            {"Cordon": "inexistente", "Ciudad": "", "ts": "sin fecha"},
+        ],
+    }
+
+
+def test_construir_filas_detalle(flex):
+    rows = flex.construir_filas_detalle(_subregs(flex))
+    defecto = flex.TARIFAS.cliente_defecto
+
+    assert len(rows) == 5
+    assert all(len(r) == len(flex.COLS_GRUPO_DETALLE) for r in rows)
+    assert rows[0] == ("2025-10-06", "Lunes", defecto, "Primer cordón", "LANUS", "Calle 1")
+    assert rows[2][2] == "otro"
+    # cordón deducido de la ciudad; fecha del ts en las semanas viejas
+    assert rows[3] == ("2025-09-30", "Martes", defecto, "Segundo cordón", "QUILMES", "Mitre 10")
+    assert rows[4] == ("", "Martes", defecto, "cordon_no_identificado", "—", "—")
+
+
+def test_agrupar_detalle(flex):
+    rows = [r for r in flex.construir_filas_detalle(_subregs(flex)) if r[0]]
+    df = flex.agrupar_detalle(rows)
+
+    assert list(df.columns) == flex.COLS_DETALLE
+    assert len(df) == 3
+    assert df["Cantidad"].sum() == 4
+    assert list(df["Remito"]) == ["RM00000001", "RM00000002", "RM00000003"]
+
+    lanus = df[df["Localidad"] == "LANUS"].iloc[0]
+    assert lanus["Fecha"] == "06/10/2025"
+    assert lanus["Cantidad"] == 2
+    assert lanus["Importe"] == 2 * flex.TARIFAS.precios_en("2025-10-06")["Primer cordón"]
+
+
+@pytest.mark.parametrize("xlsxwriter", [True, False], ids=["xlsxwriter", "openpyxl"])
+def test_escribir_xlsx_sin_fecha(flex, tmp_path, monkeypatch, xlsxwriter):
+    monkeypatch.setattr(flex, "XLSXWRITER", xlsxwriter)
+    df = flex.agrupar_detalle(flex.construir_filas_detalle(_subregs(flex)))
+    assert df["Fecha"].isna().any()  # la fila con ts ilegible
+    path = str(tmp_path / "detalle.xlsx")
+
+    flex._escribir_xlsx(df, path)
+
+    filas = list(openpyxl.load_workbook(path).active.iter_rows(values_only=True))
+    assert list(filas[0]) == flex.COLS_DETALLE
+    assert len(filas) == len(df) + 1
+    assert any(f[0] is None for f in filas[1:])
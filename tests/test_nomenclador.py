@@ -0,0 +1,42 @@
+# Nombres de lugar en las líneas de la etiqueta → zona/cordón (tarifas.json + localidades.json).
+import pytest
+
+
+@pytest.mark.parametrize("lineas, esperado", [
+    (["Calle Moreno 200", "BANFIELD"], "BANFIELD"),       # partido como calle vs. barrio suelto
+    (["Domicilio: Pilar 455", "CASTELAR"], "CASTELAR"),
+    (["LANUS", "RAMOS MEJIA"], "LANUS"),                 # mismo tipo de línea: gana el partido
+    (["PARQUE AVELLANEDA"], "PARQUE AVELLANEDA"),        # la coincidencia más larga
+    (["Moreno 1234"], "MORENO"),
+    (["REMITENTE BAZAR GADOL CABA", "Recibe: Juan", "BANFIELD"], "BANFIELD"),  # no la del remitente
+])
+def test_buscar(flex, lineas, esperado):
+    assert flex.NOMENCLADOR.buscar(lineas)[1] == esperado
+
+
+def test_cordon_de_barrio(flex):
+    assert flex.NOMENCLADOR.cordon_de("Banfield") == flex.TARIFAS.cordon_de("LOMAS DE ZAMORA")
+
+
+@pytest.mark.parametrize("linea, cp", [
+    ("B1824ABC", 1824),
+    ("Lanus Oeste B1824ABC", 1824),
+    ("CP 1876", 1876),
+    ("Código postal: 1900", 1900),
+    ("Mitre N 1850 DTO 3", None),    # no es un CPA: letras separadas
+    ("O1824ABC", None),              # sin provincia con O
+])
+def test_buscar_cp(flex, linea, cp):
+    hallado = flex.NOMENCLADOR.buscar_cp([linea])
+    assert (hallado[1] if hallado else None) == cp
+
+
+def test_resolver_lugar_cp(flex):
+    resolver = flex.resolver_lugar
+    assert resolver(["LANUS", "Mitre N 1850 DTO 3"]) == (0, "LANUS", 1.0)
+    # CP sin ciudad; CP que confirma la ciudad; CP que contradice a la ciudad en su propia línea
+    assert resolver(["Recibe: Juan", "B1878ABC"]) == (1, "QUILMES", 1.0)
+    assert resolver(["BERNAL", "B1876ABC"]) == (0, "BERNAL", 1.0)
+    assert resolver(["PILAR", "B1824ABC"]) == (1, "LANUS", flex.DESACUERDO_CP)
+    # el mismo CP en una línea de domicilio no le gana a la ciudad exacta
+    assert resolver(["PILAR", "Mitre 455 B1824ABC"]) == (0, "PILAR", 1.0)
@@ -0,0 +1,25 @@
+# Relectura dirigida de la subregión (sin Tesseract: se reemplaza la lectura por una falsa).
+from types import SimpleNamespace
+
+from PIL import Image
+
+
+def test_subregion_dirigida_usa_el_indice(flex, monkeypatch):
+    lineas = [
+        {"texto": "Calle Moreno 1234", "caja": (0, 0, 200, 20), "conf": 0.9},
+        {"texto": "Piso 2", "caja": (0, 25, 200, 45), "conf": 0.9},
+        {"texto": "MORENO", "caja": (0, 100, 200, 120), "conf": 0.9},
+        {"texto": "Av Siempre Viva 742", "caja": (0, 125, 300, 145), "conf": 0.9},
+    ]
+    recortes = []
+
+    def leer(recorte, **_):
+        recortes.append(recorte.size)
+        return "Av Siempre Viva 742"
+
+    monkeypatch.setattr(flex, "pytesseract", SimpleNamespace(image_to_string=leer))
+    img = Image.new("RGB", (400, 200), "white")
+
+    assert flex.ocr_subregion_dirigida(img, lineas, 2) == "Av Siempre Viva 742"
+    # caja de la línea 3 (no la de "Piso 2", que sigue a la primera "Moreno") con margen y escala ×2
+    assert recortes == [((306 - 0) * 2, (151 - 119) * 2)]